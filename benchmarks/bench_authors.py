@@ -0,0 +1,110 @@
+# Scaling benchmark for the Unique/New Authors aggregation. Compares the
+# original nested sameAuthor() loop from bibrun() against the indexed
+# single-pass aggregation in ncan_bibrun.aggregate on synthetic publications.
+#
+# Run with: python benchmarks/bench_authors.py [sizes...]
+
+import random
+import sys
+import time
+
+from fixtures import FIRST, LAST
+from ncan_bibrun.aggregate import authorCounts, authorKey
+
+
+def sameAuthor(author, lst):
+    # The author comparison formerly in ncan_bibrun
+    same = False
+    for elt in lst:
+        if author.split(" ")[-1] == elt.split(" ")[-1] and \
+            author[0] == elt[0]:
+                same = True
+    return same
+
+
+def syntheticPubs(numPubs, numYears=20, seed=0):
+    # Author names are distinct by authorKey(); the legacy loop only agrees
+    # with the key rule when one spelling is used per author
+    rng = random.Random(seed)
+    pool = {}
+    for first in FIRST:
+        for last in LAST:
+            pool.setdefault(authorKey(first + " " + last), first + " " + last)
+    for i in range(numPubs):
+        name = "{} {}{}".format(rng.choice(FIRST), rng.choice(LAST), i)
+        pool.setdefault(authorKey(name), name)
+    pool = sorted(pool.values())
+    pubs = []
+    for i in range(numPubs):
+        authors = rng.sample(pool, rng.randint(1, 8))
+        pubs.append({"pmid": i + 1,
+            "year": 2000 + rng.randrange(numYears),
+            "TR&D": rng.choice([1, 2, 3, 'c', 'n']),
+            "authors": None if rng.random() < 0.02 else ", ".join(authors)})
+    return pubs
+
+
+def legacyAuthorCounts(pubs, trdList, minYear, maxYear):
+    # The author block of bibrun() prior to ncan_bibrun.aggregate
+    sumData = [{"TR&D": trd, "Year": yr, "Unique Authors": 0,
+        "New Authors": 0, "authors": []}
+        for trd in trdList for yr in range(minYear, maxYear + 1)]
+    newAuthors = {}
+    for trd in trdList:
+        for yr in range(minYear, maxYear + 1):
+            newAuthors[(trd, yr)] = []
+    for sumStat in sumData:
+        key = (sumStat["TR&D"], sumStat["Year"])
+        for pub in pubs:
+            if pub["authors"] is not None:
+                authors = pub["authors"].split(", ")
+                if pub["year"] == sumStat["Year"] and \
+                    (pub["TR&D"] == sumStat["TR&D"] or \
+                    sumStat["TR&D"] == "Total"):
+                        sumStat["authors"] += [pubAuthor for pubAuthor in authors
+                            if not sameAuthor(pubAuthor, sumStat["authors"])]
+                if (pub["TR&D"] == sumStat["TR&D"] or \
+                    sumStat["TR&D"] == 'Total') and \
+                    pub["year"] <= sumStat["Year"]:
+                        newAuthors[key] += [pubAuthor for pubAuthor in authors
+                            if not sameAuthor(pubAuthor, newAuthors[key])]
+            if sumStat["Year"] > minYear:
+                for past in range(minYear, sumStat["Year"]):
+                    newAuthors[key] = [author for author in newAuthors[key]
+                        if author not in newAuthors[(sumStat["TR&D"], past)]]
+                sumStat["New Authors"] = len(newAuthors[key])
+            sumStat["Unique Authors"] = len(sumStat["authors"])
+    return {(sumStat["TR&D"], sumStat["Year"]):
+        (sumStat["Unique Authors"], sumStat["New Authors"])
+        for sumStat in sumData}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    trdList = [1, 2, 3, 'c', 'n', 'Total']
+    print("{:>8} {:>12} {:>12} {:>9}".format("pubs", "legacy (s)",
+        "indexed (s)", "speedup"))
+    for size in sizes:
+        pubs = syntheticPubs(size)
+        years = [pub["year"] for pub in pubs]
+        args = (pubs, trdList, min(years), max(years))
+        indexed, indexedTime = timed(authorCounts, *args)
+        if size <= 1000:
+            legacy, legacyTime = timed(legacyAuthorCounts, *args)
+            if legacy != indexed:
+                sys.exit("Author counts differ from the legacy loop at "
+                    "{} pubs".format(size))
+            print("{:>8} {:>12.3f} {:>12.4f} {:>8.0f}x".format(size,
+                legacyTime, indexedTime, legacyTime / max(indexedTime, 1e-9)))
+        else:
+            print("{:>8} {:>12} {:>12.4f} {:>9}".format(size, "-",
+                indexedTime, "-"))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [50, 100, 250, 500, 10000])
@@ -0,0 +1,74 @@
+# Benchmark for workbook export. Compares peak Python memory and time of
+# writing synthetic pubData rows with the streaming writer in
+# ncan_bibrun.export against a plain in-memory xlsxwriter Workbook.
+#
+# Run with: python benchmarks/bench_export.py [numPubs]
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import xlsxwriter
+from ncan_bibrun.export import writeWorkbook
+
+FIELDS = ["pmid", "year", "title", "authors", "journal",
+    "relative_citation_ratio", "nih_percentile", "citation_count", "TR&D",
+    "JIF", "JIF Percentile", "JIF Quartile", "cited_by_tweeters_count"]
+
+
+def syntheticRows(numPubs, seed=0):
+    rng = random.Random(seed)
+    for i in range(numPubs):
+        yield {"pmid": 20000000 + i, "year": 2000 + rng.randrange(20),
+            "title": "Synthetic publication title number {}".format(i),
+            "authors": ", ".join("Author{} X".format(rng.randrange(5000))
+                for j in range(rng.randint(1, 8))),
+            "journal": "J SYNTH {}".format(rng.randrange(300)),
+            "relative_citation_ratio": rng.random()*3,
+            "nih_percentile": rng.random()*100,
+            "citation_count": rng.randrange(500), "TR&D": rng.randint(1, 3),
+            "JIF": rng.random()*10, "JIF Percentile": rng.random()*100,
+            "JIF Quartile": rng.randint(1, 4),
+            "cited_by_tweeters_count": rng.randrange(50)}
+
+
+def inMemoryWorkbook(fileName, pubs, pubsHeader, sumData, sumHeader):
+    # The cell-by-cell writer bibrun() used before ncan_bibrun.export
+    workbook = xlsxwriter.Workbook(fileName)
+    bold = workbook.add_format({'bold': True})
+    pubData = workbook.add_worksheet('pubData')
+    for col, header in enumerate(sorted(pubsHeader)):
+        pubData.write(0, col, header, bold)
+    for row, pub in enumerate(pubs, 1):
+        for col, header in enumerate(sorted(pubsHeader)):
+            if header in pub.keys():
+                pubData.write(row, col, pub[header])
+    workbook.close()
+
+
+def measure(writer, pubs, directory):
+    fileName = os.path.join(directory, writer.__name__ + ".xlsx")
+    sumData = [{"Year": 2000}]
+    tracemalloc.start()
+    start = time.perf_counter()
+    writer(fileName, pubs, sorted(FIELDS), sumData, ["Year"])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(numPubs):
+    pubs = list(syntheticRows(numPubs))
+    with tempfile.TemporaryDirectory() as directory:
+        for writer in [inMemoryWorkbook, writeWorkbook]:
+            elapsed, peak = measure(writer, pubs, directory)
+            print("{:<18} {:>8.2f} s {:>10.1f} MB peak".format(
+                writer.__name__, elapsed, peak/2**20))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
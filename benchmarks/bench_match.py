@@ -0,0 +1,75 @@
+# Benchmark for fuzzy journal matching. Compares the brute-force
+# SequenceMatcher scan over every JCR title formerly done by bibrun() against
+# JournalMatcher.suggest() on perturbed journal abbreviations.
+#
+# Run with: python benchmarks/bench_match.py [numQueries]
+
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+
+from ncan_bibrun.match import JournalIndex
+from ncan_bibrun.settings import packageFile
+
+
+def similar(str1, str2):
+    # The similarity score formerly in ncan_bibrun
+    return SequenceMatcher(None, str1, str2).ratio()
+
+
+def bruteForceSuggest(journal, listofjournals):
+    # The suggestion loop of bibrun() prior to JournalMatcher
+    simJournals = {}
+    for name in listofjournals:
+        if similar(journal, name) >= 0.7 and journal[0] == name[0]:
+            simJournals[similar(journal, name)] = name
+    return [simJournals[simJ]
+        for simJ in reversed(sorted(simJournals.keys()))][:3]
+
+
+def perturb(title, rng):
+    # Mimic PubMed/JCR abbreviation drift: truncated, dropped or added words
+    words = title.split(" ")
+    choice = rng.randrange(4)
+    if choice == 0 and len(words) > 1:
+        words[rng.randrange(len(words))] = ""
+    elif choice == 1:
+        index = rng.randrange(len(words))
+        words[index] = words[index][:max(1, len(words[index]) - 2)]
+    elif choice == 2:
+        words.append(rng.choice(["UK", "USA", "SWITZ", "LOND", "RES", "REP"]))
+    return " ".join(word for word in words if word) or title
+
+
+def main(numQueries):
+    rng = random.Random(0)
+    index = JournalIndex.fromCSV(packageFile('JournalHomeGrid.csv'))
+    titles = index.titles()
+    queries = [perturb(rng.choice(titles), rng) for i in range(numQueries)]
+
+    start = time.perf_counter()
+    matcher = index.matcher()
+    buildTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [matcher.suggest(query) for query in queries]
+    fastTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    slow = [bruteForceSuggest(query, titles) for query in queries]
+    slowTime = time.perf_counter() - start
+
+    mismatches = [query for query, a, b in zip(queries, fast, slow) if a != b]
+    print("{} queries against {} titles".format(numQueries, len(titles)))
+    print("brute force: {:.3f} s ({:.1f} ms/query)".format(slowTime,
+        1000*slowTime/numQueries))
+    print("matcher:     {:.3f} s ({:.2f} ms/query), index built in {:.3f} s".format(
+        fastTime, 1000*fastTime/numQueries, buildTime))
+    print("speedup:     {:.0f}x".format(slowTime/max(fastTime, 1e-9)))
+    if mismatches:
+        sys.exit("Suggestions differ for: {}".format(mismatches))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,100 @@
+# End-to-end benchmark of ncan_bibrun.pipeline.run() against a local stub of
+# PubMed, iCite and Altmetric serving synthetic data (see fixtures.py), so
+# runs are reproducible and never touch the real services. Each size is run
+# twice: cold, fetching everything from the stub, then warm, from the
+# response cache. Prints the time of each phase. Peak memory is measured in
+# a separate pair of runs traced with tracemalloc, as tracing slows the
+# pipeline down several times over.
+#
+# Run with: python benchmarks/bench_pipeline.py [sizes...] [--latency S]
+#     [--throttle-every N] [--no-memory] [--report FILE]
+
+import argparse
+import json
+import os
+import tempfile
+
+from fixtures import StubServer, syntheticData
+from ncan_bibrun.instrument import Profiler
+from ncan_bibrun.pipeline import SKIP, Config, run
+
+SIZES = [100, 1000, 10000, 50000]
+
+PHASES = ["esearch", "icite", "classify", "jif", "altmetric", "summary",
+    "authors", "export"]
+
+
+def runOnce(server, directory, traceMemory=False):
+    config = Config(searchURL=server.searchURL(), classify=True,
+        altmetric=True, output=os.path.join(directory, "bench.xlsx"),
+        unresolved=SKIP, cacheDir=directory)
+    with Profiler(traceMemory=traceMemory) as profiler:
+        result = run(config)
+    return result, profiler.report()
+
+
+def runColdWarm(server, directory, traceMemory=False):
+    # A cold run into an empty cache, then a warm one from it
+    cold = runOnce(server, directory, traceMemory)
+    warm = runOnce(server, directory, traceMemory)
+    return cold, warm
+
+
+def printReport(label, report, memoryReport=None):
+    phases = report["phases"]
+    peak = ""
+    if memoryReport is not None:
+        peak = ", peak {:6.1f} MB".format(memoryReport["peakMemory"]/2**20)
+    print("  {:<5} total {:7.2f} s{} | ".format(label, report["wall"], peak) +
+        " ".join("{} {:.2f}".format(name, phases[name]["wall"])
+        for name in PHASES if name in phases))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES)
+    parser.add_argument("--latency", type=float, default=0.0,
+        help="seconds the stub waits before each response")
+    parser.add_argument("--throttle-every", type=int, default=None,
+        help="answer every Nth request with a 429")
+    parser.add_argument("--no-memory", action="store_true",
+        help="skip the traced runs measuring peak memory")
+    parser.add_argument("--report", metavar="FILE",
+        help="save every run's profile report as JSON")
+    args = parser.parse_args()
+
+    reports = {}
+    for size in args.sizes:
+        data = syntheticData(size)
+        with tempfile.TemporaryDirectory() as directory, \
+            StubServer(data, args.latency, args.throttle_every) as server:
+                server.install()
+                timedDir = os.path.join(directory, "timed")
+                os.mkdir(timedDir)
+                (cold, coldReport), (warm, warmReport) = runColdWarm(server,
+                    timedDir)
+                requests, throttled = server.requests, server.throttled
+                coldMemory = warmMemory = None
+                if not args.no_memory:
+                    memoryDir = os.path.join(directory, "memory")
+                    os.mkdir(memoryDir)
+                    (_, coldMemory), (_, warmMemory) = runColdWarm(server,
+                        memoryDir, traceMemory=True)
+                print("{} PMIDs: {} publications, {} requests ({} throttled)"
+                    .format(size, len(cold.pubs), requests, throttled))
+                printReport("cold", coldReport, coldMemory)
+                printReport("warm", warmReport, warmMemory)
+                if len(warm.pubs) != len(cold.pubs) or \
+                    warm.summary != cold.summary:
+                        raise SystemExit("Cached run differs from the "
+                            "fetched one")
+                reports[size] = {"cold": coldReport, "warm": warmReport,
+                    "coldMemory": coldMemory, "warmMemory": warmMemory}
+
+    if args.report is not None:
+        with open(args.report, 'w') as reportFile:
+            json.dump(reports, reportFile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Checks that an incremental re-run gives the same publications and summary
+# as a full run after a search, or a PMID file, changes with PMIDs both added
+# and removed, and that it reuses the publications the two runs share (all
+# but those still awaiting a TR&D). Runs offline against the stub services
+# in fixtures.py.
+#
+# Run with: python benchmarks/check_incremental.py [size]
+
+import argparse
+import math
+import os
+import tempfile
+
+from fixtures import StubServer, syntheticData
+from ncan_bibrun.cache import REFRESH
+from ncan_bibrun.pipeline import SKIP, Config, run
+
+
+def runSearch(server, directory, incremental, pmids=None):
+    # Runs the stub's search, or the list of pmids as if read from a file.
+    # Returns the Result and the number of publications reused.
+    messages = []
+    search = {"searchURL": server.searchURL()}
+    if pmids is not None:
+        search = {"pmids": pmids, "pmidSource": "synthetic.txt"}
+    config = Config(classify=True, altmetric=True, unresolved=SKIP,
+        cacheMode=REFRESH, cacheDir=directory, incremental=incremental,
+        log=messages.append, **search)
+    result = run(config)
+    reused = [int(message.split()[1]) for message in messages
+        if message.startswith("Reused ")]
+    return result, sum(reused)
+
+
+def sameValue(first, second):
+    if isinstance(first, float) and isinstance(second, float):
+        return math.isclose(first, second, rel_tol=1e-9, abs_tol=1e-9)
+    return first == second
+
+
+def differences(result, expected):
+    # Lists where result's summary rows differ from expected's
+    found = []
+    if [pub["pmid"] for pub in result.pubs] != \
+        [pub["pmid"] for pub in expected.pubs]:
+            found.append("publications differ")
+    rows = {(row.get("TR&D"), row["Year"]): row for row in result.summary}
+    for row in expected.summary:
+        key = (row.get("TR&D"), row["Year"])
+        if key not in rows:
+            found.append("{}: missing".format(key))
+            continue
+        for column, value in row.items():
+            if not sameValue(rows[key].get(column), value):
+                found.append("{} {}: {} instead of {}".format(key, column,
+                    rows[key].get(column), value))
+    if len(rows) != len(expected.summary):
+        found.append("{} rows instead of {}".format(len(rows),
+            len(expected.summary)))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("size", nargs="?", type=int, default=200)
+    args = parser.parse_args()
+
+    # The first search has the first size PMIDs; the second drops a quarter
+    # of them and adds a sixth more
+    data = syntheticData(args.size + args.size//6)
+    pmids = data[0]
+    first = pmids[:args.size]
+    second = pmids[args.size//4:]
+
+    failed = False
+    for kind in ["search", "PMID file"]:
+        with tempfile.TemporaryDirectory() as directory, \
+            StubServer(data) as server:
+                server.install()
+                incrementalDir = os.path.join(directory, "incremental")
+                fullDir = os.path.join(directory, "full")
+                os.mkdir(incrementalDir)
+                os.mkdir(fullDir)
+                lists = [first, second]
+                if kind == "search":
+                    lists = [None, None]
+                server.pmids = first
+                firstRun, reused = runSearch(server, incrementalDir, True,
+                    lists[0])
+                server.pmids = second
+                result, reused = runSearch(server, incrementalDir, True,
+                    lists[1])
+                expected, unused = runSearch(server, fullDir, False,
+                    lists[1])
+
+        found = differences(result, expected)
+        shared = len([pub for pub in firstRun.pubs
+            if pub["pmid"] in set(second) and pub["TR&D"] is not None])
+        if reused != shared:
+            found.append("reused {} publications instead of {}".format(
+                reused, shared))
+        for difference in found:
+            print("{}: {}".format(kind, difference))
+        if found:
+            failed = True
+        else:
+            print("Incremental re-run of a {} of {} -> {} PMIDs matches a "
+                "full run".format(kind, len(first), len(second)))
+    if failed:
+        raise SystemExit("Incremental re-run differs from a full run")
+
+
+if __name__ == "__main__":
+    main()
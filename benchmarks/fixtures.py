@@ -0,0 +1,219 @@
+# Synthetic PubMed, iCite and Altmetric data for offline benchmarks, and a
+# local HTTP server that serves it in place of the real services with
+# configurable latency and throttling.
+#
+# Use from another benchmark:
+#     server = StubServer(syntheticData(1000), latency=0.01, throttleEvery=50)
+#     with server:
+#         server.install()   # point ncan_bibrun.fetch at the stub
+#         ...
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+from ncan_bibrun import fetch
+from ncan_bibrun.aggregate import ALTMETRIC_FIELDS
+from ncan_bibrun.match import JournalIndex
+from ncan_bibrun.settings import packageFile
+
+# Name pools for synthetic authors
+FIRST = ["John", "Mary", "Peter", "Susan", "Gerwin", "Theresa", "Dennis",
+    "Jonathan", "Lynn", "Anna", "Xiao", "Ravi", "Maria", "David", "Elena"]
+LAST = ["Wolpaw", "Schalk", "Brunner", "McFarland", "Vaughan", "Heckman",
+    "Carp", "McCane", "Chen", "Patel", "Garcia", "Smith", "Nguyen", "Kim",
+    "Rossi", "Muller", "Tanaka", "Silva", "Cohen", "Novak"]
+
+# Title phrases; the first few match the TR&D rules, the rest need review
+TOPICS = ["operant conditioning of the h-reflex", "spinal cord injury",
+    "a p300 speller", "eeg-based control", "brain computer interface use",
+    "electrocorticography in epilepsy", "motor cortex mapping",
+    "gait after stroke", "sleep and memory", "muscle fatigue"]
+
+FIRST_PMID = 20000000
+
+
+def journalTitles():
+    # Normalized JCR titles from the packaged JournalHomeGrid.csv
+    return JournalIndex.fromCSV(packageFile('JournalHomeGrid.csv')).titles()
+
+
+def syntheticRecord(pmid, rng, titles, authorPool, numYears=20):
+    # An iCite record. Most journals are exact JCR titles; some are drifted
+    # abbreviations or unknown journals that go through fuzzy matching.
+    journal = rng.choice(titles)
+    draw = rng.random()
+    if draw < 0.05:
+        journal = journal[:max(3, len(journal) - 2)]
+    elif draw < 0.08:
+        journal = "J SYNTH {}".format(rng.randrange(500))
+    return {"pmid": pmid,
+        "year": 2000 + rng.randrange(numYears),
+        "title": "Synthetic study {} of {}".format(pmid, rng.choice(TOPICS)),
+        "authors": ", ".join(rng.sample(authorPool, rng.randint(1, 8))),
+        "journal": journal,
+        "is_research_article": "Yes",
+        "relative_citation_ratio": round(rng.lognormvariate(0, 0.8), 2),
+        "nih_percentile": round(rng.random()*100, 1),
+        "citation_count": rng.randrange(200),
+        "doi": "10.5555/synthetic.{}".format(pmid)}
+
+
+def syntheticAltmetric(pmid, rng):
+    # An Altmetric record with counts for a random subset of sources. Some
+    # counts come back as strings, as the real API sometimes does.
+    info = {"pmid": str(pmid), "altmetric_id": pmid + 1000000,
+        "score": round(rng.random()*50, 3)}
+    for field in ALTMETRIC_FIELDS:
+        if rng.random() < 0.4:
+            count = rng.randrange(30)
+            info[field] = str(count) if rng.random() < 0.1 else count
+    return info
+
+
+def syntheticData(numPubs, seed=0, missingICite=0.01, missingAltmetric=0.2):
+    # Returns (pmids, iCite records by PMID, Altmetric records by PMID) for
+    # numPubs PMIDs. Some PMIDs have no iCite record and more have no
+    # Altmetric record, as with real searches.
+    rng = random.Random(seed)
+    titles = journalTitles()
+    authorPool = ["{} {}{}".format(rng.choice(FIRST), rng.choice(LAST), i)
+        for i in range(max(50, numPubs//2))]
+    pmids = [FIRST_PMID + i for i in range(numPubs)]
+    iCite = {}
+    altmetric = {}
+    for pmid in pmids:
+        if rng.random() >= missingICite:
+            iCite[pmid] = syntheticRecord(pmid, rng, titles, authorPool)
+        if rng.random() >= missingAltmetric:
+            altmetric[pmid] = syntheticAltmetric(pmid, rng)
+    return pmids, iCite, altmetric
+
+
+class StubServer:
+    # Serves ESearch/EFetch uilist pages, iCite batches and Altmetric records
+    # from synthetic data on localhost. Every response is delayed by latency
+    # seconds, and every throttleEvery-th request is answered with a 429.
+
+    def __init__(self, data, latency=0.0, throttleEvery=None, retryAfter=0):
+        self.pmids, self.iCite, self.altmetric = data
+        self.latency = latency
+        self.throttleEvery = throttleEvery
+        self.retryAfter = retryAfter
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+        self.saved = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/".format(self.httpd.server_port)
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+            daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
+
+    def install(self, altmetricRate=1000):
+        # Points ncan_bibrun.fetch at this server, lifting Altmetric's rate
+        # limit so the benchmark measures the client rather than the limiter
+        self.saved = (fetch.EUTILS_URL, fetch.ICITE_URL, fetch.ALTMETRIC_URL,
+            fetch.ALTMETRIC_RATE)
+        fetch.EUTILS_URL = self.url + "eutils/"
+        fetch.ICITE_URL = self.url + "icite"
+        fetch.ALTMETRIC_URL = self.url + "altmetric/"
+        fetch.ALTMETRIC_RATE = altmetricRate
+
+    def uninstall(self):
+        if self.saved is not None:
+            (fetch.EUTILS_URL, fetch.ICITE_URL, fetch.ALTMETRIC_URL,
+                fetch.ALTMETRIC_RATE) = self.saved
+            self.saved = None
+
+    def searchURL(self):
+        # A PubMed search URL that esearchURL() turns into this server's
+        # ESearch once installed
+        return "https://www.ncbi.nlm.nih.gov/pubmed?term=synthetic"
+
+    def throttle(self):
+        with self.lock:
+            self.requests += 1
+            if self.throttleEvery and self.requests % self.throttleEvery == 0:
+                self.throttled += 1
+                return True
+        return False
+
+    def idList(self, query, root):
+        start = int(query.get("retstart", ["0"])[0])
+        size = int(query.get("retmax", ["20"])[0])
+        ids = "".join("<Id>{}</Id>".format(pmid)
+            for pmid in self.pmids[start:start + size])
+        if root == "IdList":
+            return "<IdList>{}</IdList>".format(ids)
+        return ("<eSearchResult><Count>{}</Count><RetMax>{}</RetMax>"
+            "<RetStart>{}</RetStart><QueryKey>1</QueryKey>"
+            "<WebEnv>{}</WebEnv><IdList>{}</IdList></eSearchResult>").format(
+            len(self.pmids), size, start, escape("SYNTHETIC_WEBENV"), ids)
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send(self, status, body, contentType):
+                body = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", str(server.retryAfter))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.throttle():
+                    return self.send(429, "", "text/plain")
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                if parts.path.endswith("esearch.fcgi"):
+                    return self.send(200,
+                        server.idList(query, "eSearchResult"), "text/xml")
+                if parts.path.endswith("efetch.fcgi"):
+                    return self.send(200, server.idList(query, "IdList"),
+                        "text/xml")
+                if parts.path == "/icite":
+                    pmids = query.get("pmids", [""])[0].split(",")
+                    data = [server.iCite[int(pmid)] for pmid in pmids
+                        if pmid.isdigit() and int(pmid) in server.iCite]
+                    return self.send(200, json.dumps({"data": data}),
+                        "application/json")
+                if parts.path.startswith("/altmetric/"):
+                    pmid = parts.path.rsplit("/", 1)[1]
+                    if pmid.isdigit() and int(pmid) in server.altmetric:
+                        return self.send(200,
+                            json.dumps(server.altmetric[int(pmid)]),
+                            "application/json")
+                    return self.send(404, "Not Found", "text/plain")
+                self.send(404, "Not Found", "text/plain")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,13 @@
+# Lets the assessment run as "python -m ncan_bibrun", with the same options
+# as the ncan-bibrun command.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import sys
+from ncan_bibrun.cli import main
+
+sys.exit(main())
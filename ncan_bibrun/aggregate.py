@@ -0,0 +1,169 @@
+# Aggregates per-(TR&D, year) summary statistics for the NCAN Bibliometric
+# Assessment in a single pass over the publication list.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import collections
+
+
+def authorKey(author):
+    # Two author names refer to the same person when their last names and
+    # first initials match (the rule used by sameAuthor)
+    return (author.split(" ")[-1], author[:1])
+
+
+def authorCounts(pubs, trdList, minYear, maxYear):
+    # Bucket the normalized authors of each publication by (TR&D, year)
+    buckets = collections.defaultdict(set)
+    for pub in pubs:
+        if pub["authors"] is None:
+            continue
+        keys = {authorKey(author) for author in pub["authors"].split(", ")}
+        buckets[(pub["TR&D"], pub["year"])] |= keys
+        if pub["TR&D"] != "Total" and "Total" in trdList:
+            buckets[("Total", pub["year"])] |= keys
+
+    # Count unique authors per year and those not seen in an earlier year
+    counts = {}
+    for trd in trdList:
+        seen = set()
+        for yr in range(minYear, maxYear + 1):
+            keys = buckets.get((trd, yr), set())
+            if yr > minYear:
+                newAuthors = len(keys - seen)
+            else:
+                newAuthors = 0
+            counts[(trd, yr)] = (len(keys), newAuthors)
+            seen |= keys
+    return counts
+
+
+# Altmetric count fields and the summary column each one is tallied into
+ALTMETRIC_FIELDS = collections.OrderedDict([
+    ("cited_by_accounts_count", "Social Media Account Shares"),
+    ("cited_by_fbwalls_count", "Facebook Posts"),
+    ("cited_by_feeds_count", "Blog Posts"),
+    ("cited_by_gplus_count", "Google Plus Posts"),
+    ("cited_by_msm_count", "News Articles"),
+    ("cited_by_peer_review_sites_count", "Peer Review Site Posts"),
+    ("cited_by_posts_count", "Total Social Media Posts"),
+    ("cited_by_qna_count", "QNA Posts"),
+    ("cited_by_rdts_count", "Reddit Posts"),
+    ("cited_by_tweeters_count", "Tweets"),
+    ("cited_by_wikipedia_count", "Wikipedia Mentions")])
+
+
+def emptyRow(trd, yr):
+    row = {'TR&D': trd, 'Year': yr, 'Count': 0,
+        'Weighted RCR': 0, 'Mean RCR': 0, 'Average NIH Percentile': 0,
+        'Num in JIF Q1': 0, 'Percent in JIF Q1': 0,
+        'Average JIF Quartile': 0, 'Average JIF': 0, 'Sum JIF': 0,
+        'Average JIF Percentile': 0, "Unique Authors": 0, "New Authors": 0}
+    for column in ALTMETRIC_FIELDS.values():
+        row[column] = 0
+    return row
+
+
+def summarize(pubs, trdList):
+    # Returns one summary row per (TR&D, year), ordered by TR&D then year,
+    # filling every accumulator in a single pass over the publications
+    if not pubs:
+        return []
+    minYear = min(pub["year"] for pub in pubs)
+    maxYear = max(pub["year"] for pub in pubs)
+    rows = collections.OrderedDict()
+    for trd in trdList:
+        for yr in range(minYear, maxYear + 1):
+            rows[(trd, yr)] = emptyRow(trd, yr)
+
+    # Running sums that only feed the averages
+    nihSums = collections.defaultdict(float)
+    quartileSums = collections.defaultdict(float)
+    percentileSums = collections.defaultdict(float)
+
+    for pub in pubs:
+        keys = [(pub["TR&D"], pub["year"])]
+        if pub["TR&D"] != "Total":
+            keys.append(("Total", pub["year"]))
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                continue
+            row["Count"] += 1
+            if pub.get("relative_citation_ratio") is not None:
+                row["Weighted RCR"] += pub["relative_citation_ratio"]
+            if pub.get("nih_percentile") is not None:
+                nihSums[key] += pub["nih_percentile"]
+            if "JIF Quartile" in pub:
+                if pub["JIF Quartile"] == 1:
+                    row["Num in JIF Q1"] += 1
+                quartileSums[key] += pub["JIF Quartile"]
+                row["Sum JIF"] += pub["JIF"]
+                percentileSums[key] += pub["JIF Percentile"]
+            for field, column in ALTMETRIC_FIELDS.items():
+                if field in pub:
+                    row[column] += pub[field]
+
+    # Turn the sums into averages and add the author counts
+    authorStats = authorCounts(pubs, trdList, minYear, maxYear)
+    for key, row in rows.items():
+        row["Unique Authors"], row["New Authors"] = authorStats[key]
+        count = row["Count"]
+        if count == 0:
+            continue
+        row["Mean RCR"] = row["Weighted RCR"]/count
+        row["Average NIH Percentile"] = nihSums[key]/count
+        row["Percent in JIF Q1"] = row["Num in JIF Q1"]/count
+        row["Average JIF Quartile"] = quartileSums[key]/count
+        row["Average JIF"] = row["Sum JIF"]/count
+        row["Average JIF Percentile"] = percentileSums[key]/count
+    return list(rows.values())
+
+
+def updateSummary(rows, pubs, trdList, changed):
+    # Brings summary rows from an earlier run up to date with pubs, given the
+    # (TR&D, year) buckets whose publications were added, removed or
+    # changed since. Only those rows, and later years of the same TR&D whose
+    # new author counts may have moved, are recomputed. Falls back to
+    # summarize() when the TR&Ds or the range of years differ.
+    if not pubs:
+        return []
+    minYear = min(pub["year"] for pub in pubs)
+    maxYear = max(pub["year"] for pub in pubs)
+    keys = [(trd, yr) for trd in trdList for yr in range(minYear, maxYear + 1)]
+    if [(row["TR&D"], row["Year"]) for row in rows] != keys:
+        return summarize(pubs, trdList)
+
+    # Find the first changed year of each TR&D, counting Total as changed
+    # whenever any TR&D is
+    first = {}
+    for trd, yr in changed:
+        for key in [trd, "Total"]:
+            if key in trdList:
+                first[key] = min(first.get(key, yr), yr)
+    dirty = {(trd, yr) for trd, start in first.items()
+        for yr in range(max(start, minYear), maxYear + 1)}
+    if not dirty:
+        return rows
+
+    # Recompute the dirty rows from the pubs in them, then take author counts
+    # from each affected TR&D's full history
+    subset = [pub for pub in pubs if (pub["TR&D"], pub["year"]) in dirty or
+        ("Total", pub["year"]) in dirty]
+    fresh = {(row["TR&D"], row["Year"]): row
+        for row in summarize(subset, trdList)}
+    history = pubs if "Total" in first else \
+        [pub for pub in pubs if pub["TR&D"] in first]
+    authorStats = authorCounts(history, list(first), minYear, maxYear)
+
+    updated = []
+    for key, row in zip(keys, rows):
+        if key in dirty:
+            row = fresh.get(key) or emptyRow(*key)
+            row["Unique Authors"], row["New Authors"] = authorStats[key]
+        updated.append(row)
+    return updated
@@ -0,0 +1,209 @@
+# Runs the NCAN Bibliometric Assessment for a manifest of PubMed searches at
+# once, writing one output per search and a combined summary across them.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import collections
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ncan_bibrun.cache import NORMAL, OFFLINE, ResponseCache
+from ncan_bibrun.export import checkFormat, writeSummary
+from ncan_bibrun.fetch import fetchAltmetric
+from ncan_bibrun.instrument import phase
+from ncan_bibrun.match import AliasStore, JournalIndex
+from ncan_bibrun.metrics import MetricsStore
+from ncan_bibrun.pipeline import DEFAULT_OUTPUT, QUEUE, SUMMARY_HEADER, \
+    Config, RunError, getPMIDs, getPubs, run
+from ncan_bibrun.table import PublicationTable
+
+DEFAULT_SUMMARY = os.path.join(os.path.dirname(DEFAULT_OUTPUT),
+    "NCAN Bibliometric Summary.xlsx")
+
+# Name of the combined summary rows covering every search's publications
+ALL_SEARCHES = "All Searches"
+
+# Set in each worker process by initWorker()
+shared = {}
+
+
+class Search:
+    # One entry of a manifest: a name with either a PubMed searchURL or a
+    # list of pmids, and optionally the output file for its results
+
+    def __init__(self, name, searchURL=None, pmids=None, output=None):
+        if (searchURL is None) == (pmids is None):
+            raise ValueError("Search {} needs either a url or pmids".format(
+                name))
+        if searchURL is not None and not isinstance(searchURL, str):
+            raise ValueError("The url of search {} must be a string".format(
+                name))
+        if pmids is not None and (not isinstance(pmids, list) or
+            not all(str(pmid).isdigit() for pmid in pmids)):
+                raise ValueError("The pmids of search {} must be a list of "
+                    "PubMed IDs".format(name))
+        if output is not None and not isinstance(output, str):
+            raise ValueError("The output of search {} must be a file "
+                "name".format(name))
+        if output is not None:
+            checkFormat(output, "The output of search " + name)
+        self.name = name
+        self.searchURL = searchURL
+        self.pmids = pmids
+        self.output = output
+
+
+def readManifest(fileName):
+    # A JSON list of searches such as
+    # [{"name": "P41", "url": "https://www.ncbi.nlm.nih.gov/pubmed?..."},
+    #  {"name": "Schalk", "pmids": [23456789, ...], "output": "Schalk.csv"}]
+    with open(fileName, 'r') as manifestFile:
+        entries = json.load(manifestFile)
+    if not isinstance(entries, list):
+        raise ValueError("A manifest must be a list of searches")
+    searches = []
+    for entry in entries:
+        if not isinstance(entry, dict) or "name" not in entry:
+            raise ValueError("Every search in a manifest needs a name")
+        unknown = set(entry) - {"name", "url", "pmids", "output"}
+        if unknown:
+            raise ValueError("Unknown fields in search {}: {}".format(
+                entry["name"], ", ".join(sorted(unknown))))
+        searches.append(Search(str(entry["name"]), entry.get("url"),
+            entry.get("pmids"), entry.get("output")))
+    names = [search.name for search in searches]
+    if len(set(names)) < len(names):
+        raise ValueError("Search names in a manifest must be unique")
+    return searches
+
+
+def searchOutput(search, output):
+    # A search's own output goes next to the combined summary, named after
+    # the search and in the same format
+    if search.output is not None:
+        return search.output
+    name = re.sub(r'[\\/:*?"<>|]', "_", search.name)
+    return os.path.join(os.path.dirname(output),
+        name + os.path.splitext(output)[1])
+
+
+def initWorker(metricsStore, journalIndex, aliasStore):
+    # Every search in a worker shares the journal metrics, index and alias
+    # table loaded once by the parent. The metrics store arrives as its path
+    # and is mapped again, so all workers share one copy of it.
+    shared["metricsStore"] = metricsStore
+    shared["journalIndex"] = journalIndex
+    shared["aliasStore"] = aliasStore
+
+
+def runSearch(pmids, output, options):
+    # Runs one search in a worker. Its responses were already fetched into
+    # the cache by the parent, so it never touches the network.
+    return run(Config(pmids=pmids, output=output, cacheMode=OFFLINE,
+        metricsStore=shared["metricsStore"],
+        journalIndex=shared["journalIndex"], aliasStore=shared["aliasStore"],
+        **options))
+
+
+def runBatch(searches, output=DEFAULT_SUMMARY, classify=False, rules=None,
+    altmetric=False, unresolved=QUEUE, metrics=None, classifier=None,
+    metricsStore=None, cacheMode=NORMAL, cacheDir=None, workers=None,
+    log=None):
+    # Runs each search across a pool of worker processes and writes the
+    # combined summary to output. The PMIDs of every search are resolved and
+    # their iCite and Altmetric data fetched into the cache first, so PMIDs
+    # shared between searches are fetched only once. classifier and
+    # metricsStore may be given if the rules and metrics have already been
+    # loaded. Returns a dict of search
+    # name to Result; searches that fail, for whatever reason, are logged and
+    # left out so the others still make the combined summary.
+    log = log or (lambda message: None)
+    cache = ResponseCache.open(cacheMode, cacheDir)
+    try:
+        pmidLists = collections.OrderedDict()
+        with phase("esearch"):
+            for search in searches:
+                pmidLists[search.name] = getPMIDs(Config(
+                    searchURL=search.searchURL, pmids=search.pmids), cache)
+        allPMIDs = list(collections.OrderedDict.fromkeys(pmid
+            for pmidList in pmidLists.values() for pmid in pmidList))
+        log("{} PubMed IDs obtained for {} searches ({} distinct).".format(
+            sum(len(pmidList) for pmidList in pmidLists.values()),
+            len(searches), len(allPMIDs)))
+        with phase("icite"):
+            getPubs(allPMIDs, cache)
+        log("iCite data collected.")
+        if altmetric:
+            with phase("altmetric"):
+                cache.fetchThrough("altmetric", allPMIDs, fetchAltmetric)
+            log("Altmetric data collected.")
+    finally:
+        cache.close()
+
+    # Compile the journal metrics (if out of date) and index them once for
+    # every worker
+    with phase("jif"):
+        aliasStore = AliasStore.load(cacheDir)
+        metricsStore = metricsStore or MetricsStore.load(metrics, cacheDir)
+        journalIndex = JournalIndex.fromTitles(metricsStore.fullTitles(),
+            aliasStore.confirmed)
+
+    options = {"classify": classify, "rules": rules, "classifier": classifier,
+        "altmetric": altmetric, "unresolved": unresolved, "metrics": metrics,
+        "cacheDir": cacheDir}
+    results = {}
+    workers = min(workers or os.cpu_count() or 1, len(searches)) or 1
+    with phase("searches"), ProcessPoolExecutor(workers,
+        initializer=initWorker, initargs=(metricsStore, journalIndex,
+        aliasStore)) as pool:
+        futures = {pool.submit(runSearch, pmidLists[search.name],
+            searchOutput(search, output), options): search.name
+            for search in searches}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except RunError as error:
+                log("{}: {}".format(name, error))
+                continue
+            except Exception as error:
+                log("{}: failed with {}: {}".format(name,
+                    type(error).__name__, error))
+                continue
+            log("{}: {} publications written to {}".format(name,
+                len(results[name].pubs), ", ".join(results[name].outputFiles)))
+
+    if results:
+        with phase("export"):
+            writeSummary(output, *combinedSummary(searches, results,
+                classify))
+        log("Combined summary written to " + output)
+    return results
+
+
+def combinedSummary(searches, results, classify):
+    # The summary rows of every search, tagged with its name, followed by
+    # rows for the distinct publications of all searches together. Returns
+    # the rows and their header.
+    rows = []
+    allPubs = collections.OrderedDict()
+    trdList = []
+    for search in searches:
+        if search.name not in results:
+            continue
+        for row in results[search.name].summary:
+            rows.append(dict(row, Search=search.name))
+            if row["TR&D"] not in trdList:
+                trdList.append(row["TR&D"])
+        for pub in results[search.name].pubs:
+            allPubs.setdefault(pub["pmid"], pub)
+    for row in PublicationTable.fromPubs(allPubs.values()).summarize(
+        trdList):
+        rows.append(dict(row, Search=ALL_SEARCHES))
+    header = ["Search"] + (['TR&D'] if classify else []) + SUMMARY_HEADER
+    return rows, header
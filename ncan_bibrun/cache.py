@@ -0,0 +1,142 @@
+# On-disk cache of PubMed, iCite and Altmetric responses for the NCAN
+# Bibliometric Assessment, so repeated runs only hit the network for stale
+# or missing records.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from ncan_bibrun.settings import cacheDir
+
+# How long responses from each source stay fresh, in seconds
+TTLS = {"pubmed": 60*60,
+    "icite": 7*24*60*60,
+    "altmetric": 24*60*60}
+
+MAX_BYTES = 256*1024*1024
+
+# Cache modes: use fresh entries and fetch the rest, never touch the
+# network, or refetch everything
+NORMAL = "normal"
+OFFLINE = "offline"
+REFRESH = "refresh"
+MODES = [NORMAL, OFFLINE, REFRESH]
+
+
+class ResponseCache:
+    # SQLite table of JSON values keyed by (source, key), e.g. ("icite",
+    # PMID). Entries past their source's TTL are stale; once the cache grows
+    # past maxBytes the least recently used entries are evicted.
+
+    FILE_NAME = "responses.sqlite"
+
+    def __init__(self, path, mode=NORMAL, ttls=None, maxBytes=MAX_BYTES):
+        if mode not in MODES:
+            raise ValueError("Unknown cache mode: " + str(mode))
+        self.path = path
+        self.mode = mode
+        self.ttls = dict(TTLS)
+        self.ttls.update(ttls or {})
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        # Batch runs share the file between processes, so wait out their
+        # writes rather than failing
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+            "source TEXT, key TEXT, value TEXT, fetched REAL, accessed REAL, "
+            "size INTEGER, PRIMARY KEY (source, key))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS accessedIndex "
+            "ON responses (accessed)")
+        self.db.commit()
+
+    @classmethod
+    def open(cls, mode=NORMAL, directory=None, **kwargs):
+        return cls(os.path.join(cacheDir(directory), cls.FILE_NAME), mode,
+            **kwargs)
+
+    def close(self):
+        self.db.close()
+
+    def getMany(self, source, keys):
+        # Returns a dict of the cached values of keys that are fresh, or of
+        # any age when offline. Refresh mode never returns cached values.
+        if self.mode == REFRESH:
+            return {}
+        keys = [str(key) for key in keys]
+        oldest = 0 if self.mode == OFFLINE else time.time() - self.ttls[source]
+        found = {}
+        with self.lock:
+            # SQLite limits the number of parameters in one query
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.db.execute("SELECT key, value FROM responses "
+                    "WHERE source = ? AND fetched >= ? AND key IN (" +
+                    ",".join("?"*len(chunk)) + ")", [source, oldest] + chunk)
+                for key, value in rows:
+                    found[key] = json.loads(value)
+            now = time.time()
+            self.db.executemany("UPDATE responses SET accessed = ? "
+                "WHERE source = ? AND key = ?",
+                [(now, source, key) for key in found])
+            self.db.commit()
+        return found
+
+    def get(self, source, key, default=None):
+        return self.getMany(source, [key]).get(str(key), default)
+
+    def putMany(self, source, values):
+        # Stores a dict of key to JSON-serializable value
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            value = json.dumps(value)
+            rows.append((source, str(key), value, now, now, len(value)))
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO responses "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+        self.evict()
+
+    def put(self, source, key, value):
+        self.putMany(source, {key: value})
+
+    def evict(self):
+        # Drops least recently used entries until the cache is back under
+        # 90% of maxBytes
+        with self.lock:
+            total = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.maxBytes:
+                return
+            target = total - int(self.maxBytes*0.9)
+            freed = 0
+            doomed = []
+            for source, key, size in self.db.execute("SELECT source, key, "
+                "size FROM responses ORDER BY accessed"):
+                doomed.append((source, key))
+                freed += size
+                if freed >= target:
+                    break
+            self.db.executemany("DELETE FROM responses "
+                "WHERE source = ? AND key = ?", doomed)
+            self.db.commit()
+
+    def fetchThrough(self, source, keys, fetch):
+        # Returns a dict of the values of keys, taking fresh ones from the
+        # cache and the rest from fetch(missingKeys), which must return a dict
+        # keyed the same way. Nothing is fetched when offline.
+        keys = [str(key) for key in keys]
+        values = self.getMany(source, keys)
+        missing = [key for key in keys if key not in values]
+        if missing and self.mode != OFFLINE:
+            fetched = {str(key): value for key, value in fetch(missing).items()}
+            self.putMany(source, fetched)
+            values.update(fetched)
+        return values
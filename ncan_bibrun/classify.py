@@ -0,0 +1,103 @@
+# Classifies publications into TR&Ds by keyword rules loaded from a JSON
+# file (trd_rules.json by default).
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import json
+import re
+from ncan_bibrun.settings import packageFile
+
+
+def trieRegex(keywords):
+    # Builds a regex matching any of the keywords from a trie of them, so
+    # each position in a title is checked one character at a time instead of
+    # once per keyword. Optional branches are greedy, so the longest keyword
+    # starting at a position is the one matched.
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def branch(node):
+        alternatives = [re.escape(char) + branch(child)
+            for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1:
+            pattern = alternatives[0]
+        else:
+            pattern = "(?:" + "|".join(alternatives) + ")"
+        if "" in node:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return branch(trie)
+
+
+class Classifier:
+    # Finds every rule keyword in a title with one compiled trie regex, then
+    # picks the first TR&D group the keywords satisfy. Titles are never
+    # modified.
+
+    def __init__(self, groups, manual=()):
+        self.groups = []
+        keywords = set()
+        for group in groups:
+            anyOf = {keyword.lower() for keyword in group.get("any", [])}
+            allOf = [{keyword.lower() for keyword in keywordList}
+                for keywordList in group.get("all", [])]
+            self.groups.append((group["trd"], anyOf, allOf))
+            keywords |= anyOf
+            keywords.update(*allOf)
+        if not keywords or "" in keywords:
+            raise ValueError("TR&D rules need at least one keyword and no "
+                "empty ones")
+
+        # Only the longest keyword starting at a position is matched, so each
+        # match also stands for the keywords it contains
+        self.pattern = re.compile(trieRegex(keywords))
+        self.contains = {keyword: {other for other in keywords
+            if other in keyword} for keyword in keywords}
+        self.choices = [trd for trd, anyOf, allOf in self.groups] + \
+            list(manual)
+
+    @classmethod
+    def fromFile(cls, path=None):
+        if path is None:
+            path = packageFile('trd_rules.json')
+        with open(path, 'r') as rulesFile:
+            rules = json.load(rulesFile)
+        try:
+            return cls(rules["groups"], rules.get("manual", []))
+        except (AttributeError, KeyError, TypeError):
+            raise ValueError(path + " is not a valid TR&D rules file")
+
+    def keywords(self, title):
+        # Searching again from the character after each match start finds
+        # overlapping keywords too
+        title = title.lower()
+        found = set()
+        match = self.pattern.search(title)
+        while match is not None:
+            found |= self.contains[match.group()]
+            match = self.pattern.search(title, match.start() + 1)
+        return found
+
+    def classify(self, title):
+        # Returns the TR&D of a title, or None if no group matches
+        found = self.keywords(title)
+        if found:
+            for trd, anyOf, allOf in self.groups:
+                if found & anyOf or \
+                    any(keywords <= found for keywords in allOf):
+                        return trd
+        return None
+
+    def classifyMany(self, titles):
+        return [self.classify(title) for title in titles]
@@ -0,0 +1,213 @@
+# Command line interface for the NCAN Bibliometric Assessment. Without a
+# search URL or PMID file it falls back to the interactive bibrun().
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import argparse
+import contextlib
+import os
+import re
+import sys
+from ncan_bibrun.cache import NORMAL, OFFLINE, REFRESH
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog="ncan-bibrun",
+        description="NCAN Bibliometric Assessment. Run without a search URL "
+        "or PMID file to be asked for everything interactively.")
+    parser.add_argument("url", nargs="?",
+        help="URL of the PubMed search to assess")
+    parser.add_argument("--pmid-file", metavar="FILE",
+        help="file of PMIDs to assess instead of a search ('-' for stdin)")
+    parser.add_argument("--manifest", metavar="FILE",
+        help="JSON list of searches to assess together, each written to its "
+        "own file next to --output, which gets their combined summary")
+    parser.add_argument("--jobs", metavar="N", type=int,
+        help="worker processes for --manifest (default: one per CPU)")
+    parser.add_argument("--classify", action="store_true",
+        help="classify publications according to their TR&D")
+    parser.add_argument("--rules", metavar="FILE",
+        help="TR&D keyword rules to classify with (default: trd_rules.json "
+        "in the package)")
+    parser.add_argument("--metrics", metavar="FILE", action="append",
+        help="JCR export (.csv) or JSON list of metric datasets, e.g. JCR "
+        "exports for several years or SJR/CiteScore tables, to take each "
+        "publication's journal metrics for its year from; may be repeated "
+        "(default: the packaged 2016 JournalHomeGrid.csv)")
+    parser.add_argument("--altmetric", action="store_true",
+        help="obtain Altmetric data for each publication")
+    parser.add_argument("--output", metavar="FILE",
+        help="file to write: .xlsx for a workbook, or .csv, .parquet or "
+        ".feather for one file per table (default: NCAN Bibliometric "
+        "Data.xlsx on the Desktop)")
+    parser.add_argument("--unresolved", choices=["skip", "queue"],
+        default="queue", help="leave unclassified publications and "
+        "unconfirmed journals unresolved (skip), or also list them in a "
+        "review file (queue, the default)")
+    parser.add_argument("--review", metavar="FILE",
+        help="review file for queued items (default: next to the output)")
+    parser.add_argument("--incremental", action="store_true",
+        help="reuse the results of earlier runs of the same search, only "
+        "processing new or stale PMIDs")
+    parser.add_argument("--max-age", metavar="DAYS", type=float,
+        help="days before an --incremental result is processed again "
+        "(default: 30)")
+    parser.add_argument("--profile", metavar="FILE",
+        help="write a JSON report of the time spent in each phase, the HTTP "
+        "requests made to each service and peak memory")
+    parser.add_argument("--cprofile", metavar="FILE",
+        help="also profile the run with cProfile and dump its stats to FILE")
+    parser.add_argument("--trace-memory", action="store_true",
+        help="report the peak memory of the run itself with tracemalloc "
+        "instead of the process's peak resident size (much slower)")
+    parser.add_argument("--quiet", action="store_true",
+        help="do not print progress")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--offline", dest="cacheMode", action="store_const",
+        const=OFFLINE, help="only use cached PubMed, iCite and Altmetric data")
+    mode.add_argument("--refresh", dest="cacheMode", action="store_const",
+        const=REFRESH, help="refetch everything, ignoring cached data")
+    return parser
+
+
+def readPMIDs(fileName):
+    # PMIDs separated by whitespace or commas
+    if fileName == "-":
+        text = sys.stdin.read()
+    else:
+        with open(fileName, 'r') as pmidFile:
+            text = pmidFile.read()
+    return [pmid for pmid in re.split(r"[\s,]+", text) if pmid]
+
+
+def pmidSource(fileName):
+    # PMID files are told apart by their absolute path across --incremental
+    # runs; PMIDs from stdin only by the whole list
+    if fileName is None or fileName == "-":
+        return None
+    return os.path.abspath(fileName)
+
+
+def profiling(args):
+    # Profiles the run when --profile or --cprofile is given. Batch runs
+    # only measure the parent process, i.e. the shared fetches.
+    if args.profile is None and args.cprofile is None:
+        return contextlib.nullcontext()
+    from ncan_bibrun.instrument import Profiler
+    return Profiler(args.profile, args.cprofile, args.trace_memory)
+
+
+def loadMetrics(argParser, args):
+    # Compiles the journal metrics (if out of date) before anything is
+    # fetched, so missing or unreadable --metrics files are reported at once
+    from ncan_bibrun.metrics import MetricsStore
+    try:
+        return MetricsStore.load(args.metrics)
+    except (OSError, ValueError) as error:
+        argParser.error(str(error))
+
+
+def loadClassifier(argParser, args):
+    # Reads the TR&D rules up front, so a missing or malformed --rules file
+    # is reported before anything is fetched
+    if not args.classify:
+        return None
+    from ncan_bibrun.classify import Classifier
+    try:
+        return Classifier.fromFile(args.rules)
+    except (OSError, ValueError) as error:
+        argParser.error("Cannot read the TR&D rules: " + str(error))
+
+
+def runManifest(argParser, args, cacheMode):
+    from ncan_bibrun.batch import DEFAULT_SUMMARY, readManifest, runBatch
+    from ncan_bibrun.export import checkFormat
+    from ncan_bibrun.fetch import FetchError
+    from ncan_bibrun.pipeline import RunError
+    output = args.output or DEFAULT_SUMMARY
+    try:
+        checkFormat(output, "--output")
+    except ValueError as error:
+        argParser.error(str(error))
+    try:
+        searches = readManifest(args.manifest)
+    except (OSError, ValueError) as error:
+        argParser.error(str(error))
+    classifier = loadClassifier(argParser, args)
+    metricsStore = loadMetrics(argParser, args)
+    try:
+        with profiling(args):
+            results = runBatch(searches, output, classify=args.classify,
+                rules=args.rules, altmetric=args.altmetric,
+                unresolved=args.unresolved, metrics=args.metrics,
+                classifier=classifier, metricsStore=metricsStore,
+                cacheMode=cacheMode, workers=args.jobs,
+                log=None if args.quiet else print)
+    except (FetchError, RunError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    return 0 if len(results) == len(searches) else 1
+
+
+def main(argv=None):
+    argParser = parser()
+    args = argParser.parse_args(argv)
+    if args.url is not None and args.pmid_file is not None:
+        argParser.error("give either a search URL or --pmid-file, not both")
+    if args.manifest is not None and (args.url is not None or
+        args.pmid_file is not None):
+            argParser.error("--manifest cannot be combined with a search URL "
+                "or --pmid-file")
+    if args.manifest is not None and (args.incremental or
+        args.max_age is not None or args.review is not None):
+            argParser.error("--incremental, --max-age and --review cannot be "
+                "used with --manifest")
+    if args.trace_memory and args.profile is None:
+        argParser.error("--trace-memory needs --profile")
+    cacheMode = args.cacheMode or NORMAL
+
+    from ncan_bibrun import bibrun
+    from ncan_bibrun.fetch import FetchError
+    from ncan_bibrun.pipeline import DEFAULT_OUTPUT, Config, RunError, run
+    from ncan_bibrun.state import MAX_AGE
+    if args.manifest is not None:
+        return runManifest(argParser, args, cacheMode)
+    if args.url is None and args.pmid_file is None:
+        bibrun(cacheMode)
+        return 0
+
+    pmids = None
+    if args.pmid_file is not None:
+        try:
+            pmids = readPMIDs(args.pmid_file)
+        except OSError as error:
+            argParser.error(str(error))
+    try:
+        config = Config(searchURL=args.url, pmids=pmids,
+            pmidSource=pmidSource(args.pmid_file), classify=args.classify, rules=args.rules,
+            altmetric=args.altmetric, output=args.output or DEFAULT_OUTPUT,
+            unresolved=args.unresolved, reviewFile=args.review,
+            metrics=args.metrics, classifier=loadClassifier(argParser, args),
+            metricsStore=loadMetrics(argParser, args),
+            cacheMode=cacheMode, incremental=args.incremental,
+            maxAge=MAX_AGE if args.max_age is None else args.max_age*24*60*60,
+            log=None if args.quiet else print)
+    except ValueError as error:
+        argParser.error(str(error))
+    try:
+        with profiling(args):
+            result = run(config)
+    except (FetchError, RunError) as error:
+        message = str(error)
+        if getattr(error, "statusCode", None) is not None:
+            message += " Response Code: " + str(error.statusCode)
+        print(message, file=sys.stderr)
+        return 1
+    if not args.quiet:
+        print("NCAN Bibliometric Assessment complete. Data written to " +
+            ", ".join(result.outputFiles))
+    return 0
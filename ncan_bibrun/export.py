@@ -0,0 +1,171 @@
+# Writes the results of the NCAN Bibliometric Assessment to disk as an
+# Excel workbook, CSV files or Parquet/Feather tables.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import csv
+import importlib.util
+import os
+
+FORMATS = [".xlsx", ".csv", ".parquet", ".feather"]
+
+# Formats written with the optional pyarrow package
+ARROW_FORMATS = [".parquet", ".feather"]
+
+
+def checkFormat(fileName, what="Output"):
+    # Raises ValueError, naming the file as what, unless fileName is in a
+    # format that can be written here. Checked before a run so it does not
+    # fail only once all the data is in.
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError("{} must end in one of {}".format(what,
+            ", ".join(FORMATS)))
+    if extension in ARROW_FORMATS and \
+        importlib.util.find_spec("pyarrow") is None:
+            raise ValueError("Writing {} files requires pyarrow "
+                "(pip install pyarrow)".format(extension))
+
+
+def cellValue(value):
+    # iCite returns some fields as lists, which no output format takes as is
+    if isinstance(value, (list, tuple)):
+        return "; ".join(str(item) for item in value)
+    return value
+
+
+def pubRows(pubs, pubsHeader):
+    for pub in pubs:
+        yield [cellValue(pub.get(header)) for header in pubsHeader]
+
+
+def summaryRows(sumData, sumHeader):
+    for sumStat in sumData:
+        yield [sumStat.get(header) for header in sumHeader]
+
+
+def writeSummarySheet(workbook, bold, sumData, sumHeader):
+    # The summary header is repeated after each TR&D's last year, i.e.
+    # wherever the years start over
+    years = [sumStat["Year"] for sumStat in sumData]
+    summary = workbook.add_worksheet('Summary')
+    summary.write_row(0, 0, sumHeader, bold)
+    row = 1
+    for index, values in enumerate(summaryRows(sumData, sumHeader)):
+        summary.write_row(row, 0, values)
+        row += 1
+        if index + 1 == len(years) or years[index + 1] <= years[index]:
+            summary.write_row(row, 0, sumHeader, bold)
+            row += 1
+
+
+def writeWorkbook(fileName, pubs, pubsHeader, sumData, sumHeader):
+    # Writes the pubData and Summary worksheets row by row in xlsxwriter's
+    # constant_memory mode, so only one row is held in memory at a time
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(fileName, {'constant_memory': True})
+    bold = workbook.add_format({'bold': True})
+
+    pubData = workbook.add_worksheet('pubData')
+    pubData.write_row(0, 0, [header.replace("_", " ").title()
+        for header in pubsHeader], bold)
+    for row, values in enumerate(pubRows(pubs, pubsHeader), 1):
+        pubData.write_row(row, 0, values)
+
+    writeSummarySheet(workbook, bold, sumData, sumHeader)
+    workbook.close()
+
+
+def writeCSV(fileName, header, rows):
+    with open(fileName, 'w', newline='') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def writeArrow(fileName, header, rows, fileFormat):
+    # Writes a Parquet or Feather table; needs the optional pyarrow package
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Writing {} files requires pyarrow "
+            "(pip install pyarrow)".format(fileFormat))
+    columns = [[] for header in header]
+    for values in rows:
+        for column, value in zip(columns, values):
+            column.append(value)
+    arrays = []
+    for column in columns:
+        try:
+            arrays.append(pyarrow.array(column))
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            # Mixed columns such as TR&D (1, 2, 3, 'c', 'n') become text
+            arrays.append(pyarrow.array([None if value is None else str(value)
+                for value in column]))
+    table = pyarrow.Table.from_arrays(arrays, names=list(header))
+    if fileFormat == ".parquet":
+        pyarrow.parquet.write_table(table, fileName)
+    else:
+        pyarrow.feather.write_feather(table, fileName)
+
+
+def writeOutput(fileName, pubs, pubsHeader, sumData, sumHeader):
+    # Writes the results in the format given by fileName's extension. Formats
+    # other than .xlsx hold one table per file, so the publications and the
+    # summary go to "<name> pubData<ext>" and "<name> Summary<ext>". Returns
+    # the files written.
+    stem, extension = os.path.splitext(fileName)
+    extension = extension.lower()
+    if extension not in FORMATS:
+        raise ValueError("Unknown output format: " + extension)
+    if extension == ".xlsx":
+        writeWorkbook(fileName, pubs, pubsHeader, sumData, sumHeader)
+        return [fileName]
+
+    files = [stem + " pubData" + extension, stem + " Summary" + extension]
+    tables = [(pubsHeader, pubRows(pubs, pubsHeader)),
+        (sumHeader, summaryRows(sumData, sumHeader))]
+    for tableFile, (header, rows) in zip(files, tables):
+        if extension == ".csv":
+            writeCSV(tableFile, header, rows)
+        else:
+            writeArrow(tableFile, header, rows, extension)
+    return files
+
+
+def writeSummary(fileName, sumData, sumHeader):
+    # Writes only summary rows, as a workbook with a single Summary sheet or
+    # as one table in the format given by fileName's extension
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError("Unknown output format: " + extension)
+    if extension == ".xlsx":
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(fileName, {'constant_memory': True})
+        writeSummarySheet(workbook, workbook.add_format({'bold': True}),
+            sumData, sumHeader)
+        workbook.close()
+    elif extension == ".csv":
+        writeCSV(fileName, sumHeader, summaryRows(sumData, sumHeader))
+    else:
+        writeArrow(fileName, sumHeader, summaryRows(sumData, sumHeader),
+            extension)
+    return [fileName]
+
+
+REVIEW_HEADER = ["Type", "PMID", "Title", "Journal", "Suggestions"]
+
+
+def writeReview(fileName, unresolved):
+    # Writes the items a run could not resolve on its own for later review
+    with open(fileName, 'w', newline='') as reviewFile:
+        writer = csv.DictWriter(reviewFile, fieldnames=REVIEW_HEADER)
+        writer.writeheader()
+        for item in unresolved:
+            writer.writerow(item)
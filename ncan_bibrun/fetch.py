@@ -0,0 +1,293 @@
+# Fetches bibliometric data for the NCAN Bibliometric Assessment from the
+# web services it relies on.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ncan_bibrun.instrument import recordRequest
+
+# requests and ElementTree are imported by the functions that use them, so
+# runs answered from the cache never load them
+
+ALTMETRIC_URL = "https://api.altmetric.com/v1/pmid/"
+ICITE_URL = "https://icite.od.nih.gov/api/pubs"
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+
+# Requests per second Altmetric's free API allows
+ALTMETRIC_RATE = 5
+
+# ESearch will not page past this many results; later pages come from EFetch
+# using the search saved on the history server
+ESEARCH_LIMIT = 10000
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest a worker waits before retrying, whatever Retry-After asks for
+MAX_RETRY_DELAY = 60
+
+
+class FetchError(Exception):
+    # Raised when a web service keeps answering with an error
+
+    def __init__(self, message, statusCode=None):
+        super().__init__(message)
+        self.statusCode = statusCode
+
+
+class TokenBucket:
+    # Thread-safe token bucket allowing rate requests per second on average
+    # and bursts of up to burst requests
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst,
+                    self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens)/self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Stop handing out tokens for a while, e.g. after a 429 response
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                self.tokens + (now - self.updated)*self.rate)
+            self.updated = now
+            self.tokens = min(self.tokens, 1 - seconds*self.rate)
+
+
+def newSession(workers):
+    # A session whose connection pool can serve every worker at once
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def retryDelay(response, attempt, backoff):
+    # Honor the server's Retry-After (in seconds) when it gives one, up to
+    # MAX_RETRY_DELAY
+    try:
+        delay = float(response.headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        delay = backoff*2**attempt
+    if math.isnan(delay):
+        delay = backoff*2**attempt
+    return min(max(delay, 0), MAX_RETRY_DELAY)
+
+
+def responseSize(response, stream):
+    # Streamed bodies have not been read yet, so go by their Content-Length
+    if not stream:
+        return len(response.content)
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+def getWithRetry(session, url, limiter=None, retries=4, backoff=0.5,
+    timeout=30, stream=False):
+    # GETs url, retrying throttled, failed and timed out requests with
+    # exponential backoff. Returns the last response, or None if every
+    # attempt failed to connect.
+    import requests
+    response = None
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        started = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout):
+            recordRequest(url, "error", 0, time.perf_counter() - started)
+            response = None
+            delay = backoff*2**attempt
+        else:
+            recordRequest(url, response.status_code, responseSize(response,
+                stream), time.perf_counter() - started)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            delay = retryDelay(response, attempt, backoff)
+            if response.status_code == 429 and limiter is not None:
+                limiter.pause(delay)
+        if attempt < retries:
+            time.sleep(delay)
+    return response
+
+
+def fetchAltmetric(pmids, workers=8, rate=None, burst=None, retries=4,
+    backoff=0.5, session=None, baseURL=None):
+    # Fetches the Altmetric record of each PMID concurrently. Returns a dict
+    # mapping each PMID to its record, or to None if Altmetric has no record
+    # of it. PMIDs that still fail after every retry are left out. rate and
+    # baseURL default to ALTMETRIC_RATE and ALTMETRIC_URL as they are when
+    # called, so they can be pointed elsewhere (e.g. at a test server).
+    if session is None:
+        session = newSession(workers)
+    baseURL = baseURL or ALTMETRIC_URL
+    limiter = TokenBucket(rate or ALTMETRIC_RATE, burst or workers)
+
+    def fetchOne(pmid):
+        response = getWithRetry(session, baseURL + str(pmid), limiter,
+            retries, backoff)
+        if response is None:
+            return pmid, False, None
+        if response.status_code == 200:
+            return pmid, True, response.json()
+        if response.status_code == 404:
+            return pmid, True, None
+        return pmid, False, None
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for pmid, ok, info in pool.map(fetchOne, pmids):
+            if ok:
+                results[pmid] = info
+    return results
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetchICite(pmids, batchSize=200, workers=4, retries=4, backoff=0.5,
+    session=None, baseURL=None):
+    # Generates the iCite record of each PMID, requesting them in batches of
+    # batchSize concurrently so the URL stays short. Records are yielded as
+    # soon as their batch arrives. Raises FetchError if a batch fails.
+    # baseURL defaults to ICITE_URL.
+    pmids = [str(pmid) for pmid in pmids]
+    baseURL = baseURL or ICITE_URL
+    if session is None:
+        session = newSession(workers)
+
+    def fetchBatch(batch):
+        response = getWithRetry(session, baseURL + "?pmids=" + ",".join(batch),
+            retries=retries, backoff=backoff)
+        if response is None or response.status_code != 200:
+            raise FetchError("Error getting iCite information.",
+                None if response is None else response.status_code)
+        return response.json()["data"]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetchBatch, batch)
+            for batch in batches(pmids, batchSize)]
+        try:
+            for future in as_completed(futures):
+                for record in future.result():
+                    yield record
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def esearchURL(pubMedURL):
+    # Turns the URL of a PubMed search into the matching ESearch query
+    for prefix in ["https://www.ncbi.nlm.nih.gov/pubmed/?",
+        "https://www.ncbi.nlm.nih.gov/pubmed?"]:
+        pubMedURL = pubMedURL.replace(prefix,
+            EUTILS_URL + "esearch.fcgi?db=pubmed&")
+    pubMedURL = pubMedURL.replace("&cmd=DetailsSearch", "")
+    return re.sub(r"&(retmax|retstart|usehistory)=[^&]*", "", pubMedURL)
+
+
+def iterSearchXML(response):
+    # Incrementally parses an ESearch or EFetch uilist response, generating
+    # (tag, text) for each top-level field and each Id as it is read
+    from xml.etree import ElementTree
+    response.raw.decode_content = True
+    depth = 0
+    for event, elem in ElementTree.iterparse(response.raw,
+        events=("start", "end")):
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if elem.tag == "Id" or depth == 1:
+            yield elem.tag, elem.text
+        if elem.tag == "Id" or depth <= 1:
+            elem.clear()
+    response.close()
+
+
+def searchPubMed(pubMedURL, pageSize=1000, retries=4, backoff=0.5,
+    session=None):
+    # Runs a PubMed search and returns the number of results with a
+    # generator of their PMIDs. The first page is read before returning;
+    # later pages are requested as the generator reaches them. Raises
+    # FetchError if the search fails.
+    url = esearchURL(pubMedURL)
+    if session is None:
+        session = newSession(1)
+
+    def getPage(pageURL):
+        response = getWithRetry(session, pageURL, retries=retries,
+            backoff=backoff, stream=True)
+        if response is None or response.status_code != 200:
+            raise FetchError("Error obtaining PMIDs.",
+                None if response is None else response.status_code)
+        return iterSearchXML(response)
+
+    # Read the search fields that precede the first page of Ids
+    fields = {}
+    firstPage = getPage(url + "&usehistory=y&retmax=" + str(pageSize))
+    firstId = None
+    for tag, text in firstPage:
+        if tag == "Id":
+            firstId = text
+            break
+        fields[tag] = text
+    if "Count" not in fields:
+        raise FetchError("Error obtaining PMIDs.")
+    count = int(fields["Count"])
+
+    def pageURL(retstart):
+        if "WebEnv" in fields and "QueryKey" in fields:
+            return (EUTILS_URL + "efetch.fcgi?db=pubmed&rettype=uilist" +
+                "&retmode=xml&query_key=" + fields["QueryKey"] +
+                "&WebEnv=" + fields["WebEnv"] +
+                "&retstart={}&retmax={}".format(retstart, pageSize))
+        if retstart >= ESEARCH_LIMIT:
+            raise FetchError("PubMed search has more than {} results and "
+                "no history server session".format(ESEARCH_LIMIT))
+        return url + "&retstart={}&retmax={}".format(retstart, pageSize)
+
+    def pmids():
+        if firstId is None:
+            return
+        yield firstId
+        for tag, text in firstPage:
+            if tag == "Id":
+                yield text
+        for retstart in range(pageSize, count, pageSize):
+            for tag, text in getPage(pageURL(retstart)):
+                if tag == "Id":
+                    yield text
+
+    return count, pmids()
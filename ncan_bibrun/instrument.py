@@ -0,0 +1,204 @@
+# Lightweight instrumentation for the NCAN Bibliometric Assessment: wall and
+# CPU time per phase, HTTP request counts, bytes and latencies per endpoint,
+# and peak memory, reported as JSON so runs can be compared across versions.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import contextlib
+import json
+import platform
+import re
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# The Profiler recording the current run, if any
+active = None
+
+
+def version():
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        return None
+    try:
+        return version("ncan_bibrun")
+    except PackageNotFoundError:
+        return None
+
+
+def maxRSS():
+    # Peak resident memory of the process so far in bytes, or None where
+    # the platform does not report it. Linux gives kilobytes, macOS bytes.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak*1024
+
+
+def endpoint(url):
+    # Groups requests by host and path, dropping the PMID that ends
+    # per-article URLs such as Altmetric's
+    parts = urlsplit(url)
+    return parts.netloc + re.sub(r"/\d+$", "", parts.path)
+
+
+class Profiler:
+    # Collects the measurements of one run while it is the active profiler,
+    # writing the report to reportPath (if given) when the run ends. With
+    # cProfilePath, the run is also profiled with cProfile and its stats
+    # dumped there for pstats or snakeviz. Peak memory is the process's peak
+    # resident size, which is cheap to read but covers its whole life. With
+    # traceMemory it is the peak of Python allocations during the run, traced
+    # with tracemalloc, which slows Python code down several times over, so
+    # phase times of a traced run are not representative. cProfile only sees the thread that
+    # enabled it, so the pipeline then runs its stages in that thread.
+
+    def __init__(self, reportPath=None, cProfilePath=None,
+        traceMemory=False):
+        self.reportPath = reportPath
+        self.cProfilePath = cProfilePath
+        self.traceMemory = traceMemory
+        self.phases = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.started = None
+        self.wall = None
+        self.cpu = None
+        self.peakMemory = None
+        self.profiler = None
+
+    def __enter__(self):
+        global active
+        active = self
+        self.started = (time.perf_counter(), time.process_time())
+        self.startedTracing = self.traceMemory and \
+            not tracemalloc.is_tracing()
+        if self.startedTracing:
+            tracemalloc.start()
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+        if self.cProfilePath is not None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        global active
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.cProfilePath)
+        self.wall = time.perf_counter() - self.started[0]
+        self.cpu = time.process_time() - self.started[1]
+        if self.traceMemory:
+            self.peakMemory = tracemalloc.get_traced_memory()[1]
+        else:
+            self.peakMemory = maxRSS()
+        if self.startedTracing:
+            tracemalloc.stop()
+        active = None
+        if self.reportPath is not None:
+            self.write(self.reportPath)
+        return False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # Phases may nest (e.g. the author counts within the summary) and
+        # repeat; repeated phases add up. CPU time is that of the thread
+        # running the phase, as pipeline stages run in threads of their own,
+        # so it leaves out work handed to a pool (e.g. concurrent fetches).
+        # The report's total CPU time is the whole process's.
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            with self.lock:
+                stats = self.phases.setdefault(name,
+                    {"calls": 0, "wall": 0.0, "cpu": 0.0})
+                stats["calls"] += 1
+                stats["wall"] += wall
+                stats["cpu"] += cpu
+
+    def recordRequest(self, url, status, size, latency):
+        with self.lock:
+            stats = self.requests.setdefault(endpoint(url), {"requests": 0,
+                "bytes": 0, "seconds": 0.0, "statuses": {},
+                "latency": [0]*(len(LATENCY_BUCKETS) + 1)})
+            stats["requests"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += latency
+            status = str(status)
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            bucket = 0
+            while bucket < len(LATENCY_BUCKETS) and \
+                latency > LATENCY_BUCKETS[bucket]:
+                    bucket += 1
+            stats["latency"][bucket] += 1
+
+    def report(self):
+        labels = ["<={}s".format(bound) for bound in LATENCY_BUCKETS] + \
+            [">{}s".format(LATENCY_BUCKETS[-1])]
+        requests = {}
+        for name, stats in self.requests.items():
+            requests[name] = dict(stats,
+                latency=dict(zip(labels, stats["latency"])))
+        return {"version": version(),
+            "python": platform.python_version(),
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "peakMemory": self.peakMemory,
+            "memory": "tracemalloc" if self.traceMemory else "maxrss",
+            "phases": self.phases,
+            "requests": requests}
+
+    def write(self, fileName):
+        with open(fileName, 'w') as reportFile:
+            json.dump(self.report(), reportFile, indent=2)
+
+
+def phase(name):
+    # Times a phase of the active run; does nothing when no one is profiling
+    if active is None:
+        return contextlib.nullcontext()
+    return active.phase(name)
+
+
+def profilingCalls():
+    # Whether the active run is profiled with cProfile
+    return active is not None and active.profiler is not None
+
+
+def timed(name, items):
+    # Generates items, counting the time spent producing each as phase name.
+    # Used for stages that are generators, e.g. a search paging in.
+    iterator = iter(items)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def recordRequest(url, status, size, latency):
+    if active is not None:
+        active.recordRequest(url, status, size, latency)
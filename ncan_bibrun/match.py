@@ -0,0 +1,220 @@
+# Matches publication journals to Thompson-Reuters Journal Impact Factor (JIF)
+# information from JournalHomeGrid.csv.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import bisect
+import collections
+import csv
+import json
+import os
+from difflib import SequenceMatcher
+from ncan_bibrun.settings import cacheDir, replacing
+
+# Journal abbreviations used by PubMed that differ from their JCR title
+PAIRS = {"AMYOTROPH LATERAL SCLER FRONTOTEMPORAL DEGENER": "AMYOTROPH LAT SCL FR",
+    "FRONT NEUROSCI": "FRONT NEUROSCI SWITZ",
+    "FRONT COMPUT NEUROSCI": "FRONT COMPUT NEUROSC",
+    "J SPEECH LANG HEAR RES": "J SPEECH LANG HEAR R",
+    "IEEE TRANS NEURAL SYST REHABIL ENG": "IEEE T NEUR SYS REH",
+    "AM J PHYSIOL RENAL PHYSIOL": "AM J PHYSIOL RENAL",
+    "ARCH PHYS MED REHABIL": "ARCH PHYS MED REHAB",
+    "NEUROUROL URODYN": "NEUROUROL URODYNAM",
+    "SCI REP": "SCI REP UK",
+    "EPILEPSY BEHAV CASE REP": "EPILEPSY BEHAV",
+    "J NEUROSCI METHODS": "J NEUROSCI METH",
+    "PROC NATL ACAD SCI USA": "P NATL ACAD SCI USA",
+    "REV NEUROSCI": "REV NEUROSCIENCE",
+    "J PHYSIOL (LOND)": "J PHYSIOL LONDON",
+    "J NEUROTRAUMA": "J NEUROTRAUM"}
+
+JIF_HEADER = ["Rank", "Full Title", "JCR Title", "JIF", "JIFPercent"]
+
+def normalizeJournal(journal):
+    # PubMed journal abbreviations are compared upper-case without periods
+    return journal.upper().replace(".", "")
+
+
+def toFloat(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float(0)
+
+
+class JournalIndex:
+    # Maps normalized JCR titles (and known aliases) to their JIF information
+
+    def __init__(self, journals, aliases=None):
+        self.journals = journals
+        self.aliases = dict(PAIRS) if aliases is None else aliases
+
+    @classmethod
+    def fromCSV(cls, path):
+        journals = {}
+        with open(path, 'r') as jifFile:
+            for journal in csv.DictReader(jifFile, fieldnames=JIF_HEADER):
+                if not journal["Rank"].isnumeric():
+                    continue
+                title = journal["JCR Title"].replace("-", " ")
+
+                # Keep the first (highest ranked) entry for repeated titles
+                journals.setdefault(title, {"Rank": int(journal["Rank"]),
+                    "Full Title": journal["Full Title"],
+                    "JCR Title": title,
+                    "JIF": toFloat(journal["JIF"]),
+                    "JIFPercent": toFloat(journal["JIFPercent"])})
+        return cls(journals)
+
+    @classmethod
+    def fromTitles(cls, fullTitles, aliases=None):
+        # An index of {JCR title: full title} without JIF figures, for
+        # matching journals whose metrics are kept in a MetricsStore
+        return cls({title: {"Full Title": fullTitle or title,
+            "JCR Title": title} for title, fullTitle in fullTitles.items()},
+            aliases)
+
+    def titles(self):
+        return list(self.journals.keys())
+
+    def matcher(self):
+        # The fuzzy matcher is only needed for unmatched journals, so build
+        # it on first use
+        if getattr(self, "_matcher", None) is None:
+            self._matcher = JournalMatcher(self.titles())
+        return self._matcher
+
+    def addAlias(self, journal, title):
+        self.aliases[normalizeJournal(journal)] = title
+
+    def lookup(self, journal):
+        # Returns the JIF information for a journal, or None if unmatched
+        journal = normalizeJournal(journal)
+        title = self.aliases.get(journal, journal)
+        return self.journals.get(title)
+
+
+class AliasStore:
+    # Remembers how journals were resolved across runs: confirmed aliases
+    # (seeded with PAIRS), suggestions that were rejected, and journals known
+    # to have no JCR entry. Kept as JSON in the cache directory.
+
+    FILE_NAME = "journal_aliases.json"
+
+    def __init__(self, path, confirmed=None, rejected=None, unmatched=None):
+        self.path = path
+        self.confirmed = dict(PAIRS)
+        self.confirmed.update(confirmed or {})
+        self.rejected = {journal: set(titles)
+            for journal, titles in (rejected or {}).items()}
+        self.unmatched = set(unmatched or [])
+        self.changed = False
+
+    @classmethod
+    def load(cls, directory=None):
+        path = os.path.join(cacheDir(directory), cls.FILE_NAME)
+        try:
+            with open(path, 'r') as aliasFile:
+                saved = json.load(aliasFile)
+        except (OSError, ValueError):
+            saved = {}
+        return cls(path, saved.get("confirmed"), saved.get("rejected"),
+            saved.get("unmatched"))
+
+    def save(self):
+        if not self.changed:
+            return
+        saved = {"confirmed": {journal: title
+                for journal, title in self.confirmed.items()
+                if PAIRS.get(journal) != title},
+            "rejected": {journal: sorted(titles)
+                for journal, titles in self.rejected.items()},
+            "unmatched": sorted(self.unmatched)}
+
+        # Write to a temporary file first so an interrupted run, or another
+        # saving at the same time, cannot leave a truncated store behind
+        with replacing(self.path) as aliasFile:
+            json.dump(saved, aliasFile, indent=1, sort_keys=True)
+        self.changed = False
+
+    def confirm(self, journal, title):
+        self.confirmed[normalizeJournal(journal)] = title
+        self.unmatched.discard(normalizeJournal(journal))
+        self.changed = True
+
+    def reject(self, journal, title):
+        self.rejected.setdefault(normalizeJournal(journal), set()).add(title)
+        self.changed = True
+
+    def isRejected(self, journal, title):
+        return title in self.rejected.get(normalizeJournal(journal), ())
+
+    def markUnmatched(self, journal):
+        self.unmatched.add(normalizeJournal(journal))
+        self.changed = True
+
+    def isUnmatched(self, journal):
+        return normalizeJournal(journal) in self.unmatched
+
+
+class JournalMatcher:
+    # Suggests the JCR titles most similar to an unmatched journal. Gives the
+    # same suggestions as scoring every title with SequenceMatcher.ratio()
+    # and keeping those of at least the threshold that share its first
+    # letter, but only scores the few titles that could make the cut.
+
+    def __init__(self, titles):
+        # Titles grouped by first letter and sorted by length, along with
+        # their order in the title list and their character counts
+        self.byLetter = collections.defaultdict(list)
+        for order, title in enumerate(titles):
+            if title:
+                self.byLetter[title[0]].append((len(title), order, title,
+                    collections.Counter(title)))
+        self.lengths = {}
+        for letter, entries in self.byLetter.items():
+            entries.sort(key=lambda entry: entry[:2])
+            self.lengths[letter] = [entry[0] for entry in entries]
+
+    def candidates(self, journal, threshold):
+        # Titles whose length and characters allow a ratio >= threshold.
+        # ratio() is 2*M/(a+b), where the M matched characters can be no
+        # more than the characters the two strings have in common. The
+        # length window is padded by one so rounding never drops a title.
+        size = len(journal)
+        lengths = self.lengths.get(journal[0], [])
+        lo = bisect.bisect_left(lengths, size*threshold/(2 - threshold) - 1)
+        hi = bisect.bisect_right(lengths, size*(2 - threshold)/threshold + 1)
+        counts = collections.Counter(journal)
+        entries = self.byLetter.get(journal[0], [])
+        for length, order, title, titleCounts in entries[lo:hi]:
+            common = sum(min(count, titleCounts[char])
+                for char, count in counts.items())
+            bound = 2.0*common/(size + length)
+            if bound >= threshold:
+                yield bound, order, title
+
+    def suggest(self, journal, limit=3, threshold=0.7):
+        # Returns up to limit titles, most similar first. As with the scores
+        # kept in a dict by bibrun(), titles tying on a score collapse into
+        # the last one in title order.
+        if not journal:
+            return []
+        scores = {}
+        for bound, order, title in sorted(self.candidates(journal, threshold),
+            reverse=True):
+
+            # Stop once no remaining title can beat or tie the top scores
+            if len(scores) >= limit and \
+                bound < sorted(scores, reverse=True)[limit - 1]:
+                    break
+            score = SequenceMatcher(None, journal, title).ratio()
+            if score >= threshold and \
+                (score not in scores or scores[score][0] < order):
+                    scores[score] = (order, title)
+        return [scores[score][1]
+            for score in sorted(scores, reverse=True)[:limit]]
@@ -0,0 +1,366 @@
+# Journal metrics by (journal, year) from one or more JCR exports, or other
+# tables such as SJR or CiteScore, compiled into a memory-mapped binary file
+# so every run and worker process shares one copy that loads instantly.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import bisect
+import csv
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+from array import array
+from ncan_bibrun.match import JournalIndex, normalizeJournal
+from ncan_bibrun.settings import cacheDir, packageFile, replacing
+
+# The compiled file starts with MAGIC and the length of a JSON header giving
+# the columns, the source stamp and where each section lies
+MAGIC = b"NCANJMS1"
+
+# Bump whenever the compiled layout changes
+FORMAT_VERSION = 1
+
+# Metrics read from JCR exports
+JIF = "JIF"
+JIF_PERCENTILE = "JIF Percentile"
+
+
+def jcrYear(path):
+    # JCR exports name their year on the first line, e.g.
+    # "Journal Data Filtered By:  Selected JCR Year: 2016 ..."
+    with open(path, 'r') as jcrFile:
+        match = re.search(r"JCR Year:\s*(\d{4})", jcrFile.readline())
+    if match is None:
+        raise ValueError("Cannot tell the JCR year of {}; give it in a "
+            "dataset file".format(path))
+    return int(match.group(1))
+
+
+def readJCR(path, year=None):
+    # Returns (year, {JCR title: record}) for a JCR "Journal Home Grid"
+    # export like the packaged JournalHomeGrid.csv
+    if year is None:
+        year = jcrYear(path)
+    records = {}
+    for title, journal in JournalIndex.fromCSV(path).journals.items():
+        records[title] = {"Full Title": journal["Full Title"],
+            JIF: journal["JIF"], JIF_PERCENTILE: journal["JIFPercent"]}
+    return year, records
+
+
+def toMetric(value, decimal="."):
+    # Missing values are stored as NaN
+    try:
+        return float(value.strip().replace(decimal, "."))
+    except (AttributeError, ValueError):
+        return math.nan
+
+
+def tableTitle(title):
+    # Titles are compared the way JCR titles are indexed
+    return normalizeJournal(title).replace("-", " ").strip()
+
+
+def readTable(path, title, columns, year=None, yearColumn=None,
+    delimiter=",", decimal="."):
+    # Returns [(year, {title: record})] for a generic metrics table such as
+    # an SJR or CiteScore export. title names the journal column and columns
+    # maps each metric to its column. The year comes from yearColumn on each
+    # row, or is given for the whole file.
+    if (year is None) == (yearColumn is None):
+        raise ValueError("Give either the year or the year column of " + path)
+    byYear = {}
+    with open(path, 'r', newline='') as tableFile:
+        for row in csv.DictReader(tableFile, delimiter=delimiter):
+            rowYear = year if yearColumn is None else int(row[yearColumn])
+            key = tableTitle(row[title])
+            byYear.setdefault(rowYear, {})[key] = {metric: toMetric(
+                row.get(column), decimal) for metric, column in columns.items()}
+    return sorted(byYear.items())
+
+
+def readDatasets(path):
+    # A JSON list of datasets, e.g.
+    # [{"path": "JCR 2015.csv"},
+    #  {"path": "JCR 2017.csv", "year": 2017},
+    #  {"path": "scimagojr 2016.csv", "format": "table", "year": 2016,
+    #   "title": "Title", "columns": {"SJR": "SJR"}, "delimiter": ";",
+    #   "decimal": ","}]
+    # Relative paths are relative to the dataset file. Returns the tables
+    # and every file read.
+    with open(path, 'r') as datasetFile:
+        datasets = json.load(datasetFile)
+    if not isinstance(datasets, list):
+        raise ValueError(path + " must be a list of datasets")
+    tables = []
+    files = [path]
+    for number, dataset in enumerate(datasets, 1):
+        try:
+            dataset = dict(dataset)
+            source = os.path.join(os.path.dirname(path), dataset.pop("path"))
+            files.append(source)
+            if dataset.pop("format", "jcr") == "jcr":
+                tables.append(readJCR(source, dataset.get("year")))
+            else:
+                tables.extend(readTable(source, **dataset))
+        except (KeyError, TypeError) as error:
+            raise ValueError("Dataset {} of {} is invalid: {!r}".format(
+                number, path, error))
+    return tables, files
+
+
+def readSources(sources):
+    # Reads JCR exports (.csv) and dataset lists (.json). Tables keyed by
+    # full journal titles are mapped onto the matching JCR titles. Returns
+    # the tables and every file read.
+    tables = []
+    files = []
+    for source in sources:
+        if os.path.splitext(source)[1].lower() == ".json":
+            sourceTables, sourceFiles = readDatasets(source)
+            tables.extend(sourceTables)
+            files.extend(sourceFiles)
+        else:
+            tables.append(readJCR(source))
+            files.append(source)
+
+    jcrTitles = {}
+    for year, records in tables:
+        for title, record in records.items():
+            if record.get("Full Title"):
+                jcrTitles.setdefault(tableTitle(record["Full Title"]), title)
+    mapped = []
+    for year, records in tables:
+        mapped.append((year, {title if record.get("Full Title") else
+            jcrTitles.get(title, title): record
+            for title, record in records.items()}))
+    return mapped, files
+
+
+def sourceStamp(files):
+    stamp = [FORMAT_VERSION]
+    for path in files:
+        stat = os.stat(path)
+        stamp.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+    return stamp
+
+
+def packStrings(name, strings):
+    # Sections for a list of strings: their UTF-8 bytes end to end, and the
+    # offsets (one more than there are strings) of each into them
+    offsets = array('I', [0])
+    blob = bytearray()
+    for string in strings:
+        blob += (string or "").encode()
+        offsets.append(len(blob))
+    return [(name + "Offsets", offsets.tobytes()), (name, bytes(blob))]
+
+
+def compileStore(path, tables, sources=(), stamp=None):
+    # Writes tables of (year, {journal: record}) to path. Later tables win
+    # where they give the same metric for the same journal and year.
+    merged = {}
+    fullTitles = {}
+    columns = []
+    for year, records in tables:
+        for title, record in records.items():
+            values = merged.setdefault((title, year), {})
+            for metric, value in record.items():
+                if metric == "Full Title":
+                    if value:
+                        fullTitles[title] = value
+                    continue
+                if metric not in columns:
+                    columns.append(metric)
+                values[metric] = value
+
+    keys = sorted(merged)
+    journals = sorted({title for title, year in keys})
+    journalIds = {title: index for index, title in enumerate(journals)}
+    sections = packStrings("journals", journals) + \
+        packStrings("fullTitles", [fullTitles.get(title)
+            for title in journals]) + \
+        [("keyJournal", array('I', [journalIds[title]
+            for title, year in keys]).tobytes()),
+        ("keyYear", array('H', [year for title, year in keys]).tobytes())] + \
+        [("column " + metric, array('d', [merged[key].get(metric, math.nan)
+            for key in keys]).tobytes()) for metric in columns]
+
+    # Lay the sections out after the header, each 8-byte aligned
+    meta = {"columns": columns, "sources": list(sources), "stamp": stamp,
+        "journals": len(journals), "keys": len(keys), "sections": {}}
+    headerSize = 4096
+    while True:
+        offset = headerSize
+        for name, data in sections:
+            meta["sections"][name] = [offset, offset + len(data)]
+            offset += len(data) + (-len(data) % 8)
+        header = json.dumps(meta).encode()
+        if len(MAGIC) + 4 + len(header) <= headerSize:
+            break
+        headerSize *= 2
+
+    # Replace rather than overwrite, so processes that have the old file
+    # mapped keep a consistent copy
+    with replacing(path, 'wb') as storeFile:
+        storeFile.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for name, data in sections:
+            storeFile.seek(meta["sections"][name][0])
+            storeFile.write(data)
+        storeFile.truncate(offset)
+
+
+class MetricsStore:
+    # Read-only view of a compiled metrics file. Keys are sorted by journal
+    # then year, so lookups are binary searches straight over the mapped
+    # file and nothing is parsed up front. Pickles by path, so worker
+    # processes map the same file.
+
+    FILE_NAME = "journal_metrics.bin"
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as storeFile:
+            self.map = mmap.mmap(storeFile.fileno(), 0,
+                access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError(path + " is not a compiled metrics file")
+        length, = struct.unpack_from("<I", self.map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.meta = json.loads(self.map[start:start + length].decode())
+        self.columns = self.meta["columns"]
+        self.view = memoryview(self.map)
+        self.sections = {}
+        for name in self.meta["sections"]:
+            start, end = self.meta["sections"][name]
+            code = 'B'
+            if name.endswith("Offsets") or name == "keyJournal":
+                code = 'I'
+            elif name == "keyYear":
+                code = 'H'
+            elif name.startswith("column "):
+                code = 'd'
+            self.sections[name] = self.view[start:end].cast(code)
+        self.keyJournal = self.sections["keyJournal"]
+        self.keyYear = self.sections["keyYear"]
+        self.values = {metric: self.sections["column " + metric]
+            for metric in self.columns}
+
+    @classmethod
+    def load(cls, sources=None, directory=None):
+        # Opens the store compiled from sources (JCR exports and dataset
+        # lists; the packaged JournalHomeGrid.csv by default), compiling it
+        # into the cache directory when missing or out of date
+        sources = [os.path.abspath(source) for source in
+            sources or [packageFile('JournalHomeGrid.csv')]]
+        name = cls.FILE_NAME
+        if sources != [os.path.abspath(packageFile('JournalHomeGrid.csv'))]:
+            name = "journal_metrics_{}.bin".format(hashlib.sha1(
+                json.dumps(sources).encode()).hexdigest()[:12])
+        path = os.path.join(cacheDir(directory), name)
+        try:
+            store = cls(path)
+            stamp = store.meta["stamp"]
+            if store.meta["sources"] == sources and stamp == sourceStamp(
+                [entry[0] for entry in stamp[1:]]):
+                    return store
+            store.close()
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        tables, files = readSources(sources)
+        compileStore(path, tables, sources, sourceStamp(files))
+        return cls(path)
+
+    def close(self):
+        for view in self.sections.values():
+            view.release()
+        self.view.release()
+        self.map.close()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __len__(self):
+        return self.meta["keys"]
+
+    def string(self, name, index):
+        offsets = self.sections[name + "Offsets"]
+        return bytes(self.sections[name][offsets[index]:offsets[index + 1]]
+            ).decode()
+
+    def journal(self, index):
+        return self.string("journals", index)
+
+    def journals(self):
+        return [self.journal(index) for index in range(self.meta["journals"])]
+
+    def fullTitles(self):
+        # Dict of each journal's title to its full title, for JournalIndex
+        return {self.journal(index): self.string("fullTitles", index) or None
+            for index in range(self.meta["journals"])}
+
+    def fullTitle(self, journal):
+        index = self.journalIndex(journal)
+        if index is None:
+            return None
+        return self.string("fullTitles", index) or None
+
+    def journalIndex(self, journal):
+        low, high = 0, self.meta["journals"]
+        while low < high:
+            middle = (low + high)//2
+            if self.journal(middle) < journal:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.meta["journals"] and self.journal(low) == journal:
+            return low
+        return None
+
+    def years(self, journal):
+        index = self.journalIndex(journal)
+        if index is None:
+            return []
+        start = bisect.bisect_left(self.keyJournal, index)
+        end = bisect.bisect_right(self.keyJournal, index, start)
+        return list(self.keyYear[start:end])
+
+    def get(self, journal, year):
+        # Returns the metrics of journal for year as a dict, or None for
+        # unknown journals. Each metric is taken from its own nearest year:
+        # the year itself, else the latest earlier year with a figure for
+        # it, else the earliest later one. Metrics no year has are None.
+        # "Year" is the year the JIF came from (the nearest year with any
+        # figures when there is no JIF).
+        index = self.journalIndex(journal)
+        if index is None:
+            return None
+        start = bisect.bisect_left(self.keyJournal, index)
+        end = bisect.bisect_right(self.keyJournal, index, start)
+
+        # Keys from the year backwards, then the later years forwards
+        split = bisect.bisect_right(self.keyYear, year, start, end)
+        nearest = list(range(split - 1, start - 1, -1)) + \
+            list(range(split, end))
+        found = {"Year": self.keyYear[nearest[0]]}
+        for metric, values in self.values.items():
+            found[metric] = None
+            for key in nearest:
+                if not math.isnan(values[key]):
+                    found[metric] = values[key]
+                    if metric == JIF:
+                        found["Year"] = self.keyYear[key]
+                    break
+        return found
@@ -0,0 +1,443 @@
+# Runs the NCAN Bibliometric Assessment from a Config without prompting,
+# returning the publication and summary data as a Result.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import os
+from ncan_bibrun.aggregate import updateSummary
+from ncan_bibrun.cache import NORMAL, OFFLINE, ResponseCache
+from ncan_bibrun.classify import Classifier
+from ncan_bibrun.export import checkFormat, writeOutput, writeReview
+from ncan_bibrun.fetch import esearchURL, fetchAltmetric, fetchICite, \
+    searchPubMed
+from ncan_bibrun.instrument import phase, profilingCalls, timed
+from ncan_bibrun.match import AliasStore, JournalIndex, normalizeJournal
+from ncan_bibrun.metrics import JIF, JIF_PERCENTILE, MetricsStore
+from ncan_bibrun.state import MAX_AGE, RunState, runKey
+from ncan_bibrun.stream import batched, collect, threaded
+from ncan_bibrun.table import PublicationTable
+
+DEFAULT_OUTPUT = os.path.join(os.path.expanduser('~'), "Desktop",
+    "NCAN Bibliometric Data.xlsx")
+
+SUMMARY_HEADER = ["Year", "Count", "Weighted RCR", "Mean RCR",
+    "Average NIH Percentile", "Num in JIF Q1", "Percent in JIF Q1",
+    "Average JIF Quartile", "Average JIF", "Sum JIF",
+    "Average JIF Percentile", "Social Media Account Shares",
+    "Facebook Posts", "Blog Posts", "Google Plus Posts", "News Articles",
+    "Peer Review Site Posts", "Total Social Media Posts", "QNA Posts",
+    "Reddit Posts", "Tweets", "Wikiepedia", "Unique Authors", "New Authors"]
+
+# Journals known to have no Journal Impact Factor
+NO_JIF = ["FRONT INTEGR NEUROSCI", "FRONT NEUROENG"]
+
+# What to do with items that need a person's judgement when no one is asked:
+# leave them unresolved, or also list them in a review file
+SKIP = "skip"
+QUEUE = "queue"
+
+
+class RunError(Exception):
+    # Raised when a run cannot continue, e.g. an offline search with nothing
+    # cached
+    pass
+
+
+class Config:
+    # Settings for one run. Give either a PubMed searchURL or a list of
+    # pmids. rules is a TR&D rules file (trd_rules.json by default). With
+    # incremental, results of earlier runs younger than maxAge seconds are
+    # reused. Runs of a list of pmids are told apart by pmidSource, e.g. the
+    # file they were read from, so re-runs of a list that has since changed
+    # still reuse what they can; without one, by the whole list. metrics lists JCR exports and dataset files to take journal
+    # metrics from (the packaged JournalHomeGrid.csv by default).
+    # classifier, metricsStore, journalIndex and aliasStore may be given to
+    # share ones already loaded.
+    # askTRD(pub, choices) and confirmJournal(journal, fullTitle) may be set
+    # to ask someone about items the run cannot resolve itself; otherwise
+    # those items are handled according to unresolved.
+
+    def __init__(self, searchURL=None, pmids=None, pmidSource=None,
+        classify=False, rules=None, altmetric=False, output=None,
+        unresolved=QUEUE, reviewFile=None, cacheMode=NORMAL, cacheDir=None,
+        incremental=False, maxAge=MAX_AGE, metrics=None, classifier=None,
+        metricsStore=None, journalIndex=None, aliasStore=None, askTRD=None,
+        confirmJournal=None, log=None):
+        if (searchURL is None) == (pmids is None):
+            raise ValueError("Give either a search URL or a list of PMIDs")
+        if unresolved not in [SKIP, QUEUE]:
+            raise ValueError("Unknown unresolved mode: " + str(unresolved))
+        if output is not None:
+            checkFormat(output)
+        self.searchURL = searchURL
+        self.pmids = pmids
+        self.pmidSource = pmidSource
+        self.classify = classify
+        self.rules = rules
+        self.altmetric = altmetric
+        self.output = output
+        self.unresolved = unresolved
+        self.reviewFile = reviewFile
+        self.cacheMode = cacheMode
+        self.cacheDir = cacheDir
+        self.incremental = incremental
+        self.maxAge = maxAge
+        self.metrics = metrics
+        self.classifier = classifier
+        self.metricsStore = metricsStore
+        self.journalIndex = journalIndex
+        self.aliasStore = aliasStore
+        self.askTRD = askTRD
+        self.confirmJournal = confirmJournal
+        self.log = log or (lambda message: None)
+
+
+class Result:
+    # Everything a run produced. pubsHeader and summaryHeader list the
+    # columns of the pubs and summary rows in output order; outputFiles are
+    # the files written for output.
+
+    def __init__(self, pmids, pubs, pubsHeader, summary, summaryHeader,
+        unresolved, output=None, reviewFile=None, outputFiles=()):
+        self.pmids = pmids
+        self.pubs = pubs
+        self.pubsHeader = pubsHeader
+        self.summary = summary
+        self.summaryHeader = summaryHeader
+        self.unresolved = unresolved
+        self.output = output
+        self.reviewFile = reviewFile
+        self.outputFiles = list(outputFiles)
+
+
+def reviewItem(itemType, pub, suggestions=()):
+    return {"Type": itemType, "PMID": pub["pmid"], "Title": pub["title"],
+        "Journal": pub["journal"], "Suggestions": "; ".join(suggestions)}
+
+
+def streamPMIDs(config, cache):
+    # The PMIDs to assess: a list when they were given or cached, else a
+    # generator that pages through the search as it is consumed and caches
+    # the PMIDs once it has them all. Logs their number once it is known.
+    if config.pmids is not None:
+        pmidList = [str(pmid) for pmid in config.pmids]
+        config.log(str(len(pmidList)) + " PubMed IDs obtained.")
+        return pmidList
+    key = esearchURL(config.searchURL)
+    pmidList = cache.get("pubmed", key)
+    if pmidList is None and cache.mode == OFFLINE:
+        raise RunError("This search has not been cached yet. "
+            "Run it once online first.")
+    if pmidList is not None:
+        config.log(str(len(pmidList)) + " PubMed IDs obtained.")
+        return pmidList
+    count, pmids = searchPubMed(config.searchURL)
+
+    def pageThrough():
+        pmidList = []
+        for pmid in collect(pmids, pmidList):
+            yield pmid
+        cache.put("pubmed", key, pmidList)
+        config.log(str(len(pmidList)) + " PubMed IDs obtained.")
+    return pageThrough()
+
+
+def getPMIDs(config, cache):
+    return list(streamPMIDs(config, cache))
+
+
+def getPubs(pmidList, cache):
+    # iCite records in PMID order, remembering PMIDs iCite lacks
+    def getICite(missing):
+        records = dict.fromkeys(missing)
+        for record in fetchICite(missing):
+            records[str(record["pmid"])] = record
+        return records
+    iCite = cache.fetchThrough("icite", pmidList, getICite)
+    return [iCite[pmid] for pmid in pmidList if iCite.get(pmid) is not None]
+
+
+def classifyPubs(pubs, classifier, config, unresolved):
+    # Classify each publication according to its TR&D based on keywords,
+    # asking about the rest when possible
+    trds = classifier.classifyMany([pub["title"] for pub in pubs])
+    for pub, trd in zip(pubs, trds):
+        pub["TR&D"] = trd
+        if trd is None and config.askTRD is not None:
+            pub["TR&D"] = config.askTRD(pub, classifier.choices)
+        elif trd is None:
+            unresolved.append(reviewItem("TR&D", pub))
+
+
+def setMetrics(pub, metrics, title):
+    # Takes the journal's metrics for the publication's year, or the nearest
+    # year available, recording which year they are from
+    found = metrics.get(title, pub["year"])
+    if found is None:
+        return
+    pub["JIF Year"] = found.pop("Year")
+    for metric, value in found.items():
+        if metric in [JIF, JIF_PERCENTILE]:
+            pub[metric] = value or 0
+        elif value is not None:
+            pub[metric] = value
+
+
+def matchJournals(pubs, journalIndex, metrics, aliasStore, config,
+    unresolved):
+    # Compare each pub against JIF info
+    for pub in pubs:
+        pub["journal"] = normalizeJournal(pub["journal"])
+
+        #Check if it's a known journal or one we've already paired
+        journal = journalIndex.lookup(pub["journal"])
+        pub["JIF"] = 0
+        pub["JIF Percentile"] = 0
+        if journal is not None:
+            setMetrics(pub, metrics, journal["JCR Title"])
+            continue
+
+        # See what the top 3 similar journals are and present to user
+        if pub["journal"] in NO_JIF or aliasStore.isUnmatched(pub["journal"]):
+            continue
+        suggestions = [title
+            for title in journalIndex.matcher().suggest(pub["journal"])
+            if not aliasStore.isRejected(pub["journal"], title)]
+        if config.confirmJournal is None:
+            if suggestions:
+                unresolved.append(reviewItem("journal", pub,
+                    [journalIndex.journals[title]["Full Title"]
+                    for title in suggestions]))
+            continue
+        for title in suggestions:
+            journal = journalIndex.journals[title]
+            if config.confirmJournal(pub["journal"], journal["Full Title"]):
+                setMetrics(pub, metrics, title)
+                aliasStore.confirm(pub["journal"], title)
+                break
+            aliasStore.reject(pub["journal"], title)
+        else:
+            aliasStore.markUnmatched(pub["journal"])
+
+    #Determine JIF Quartiles
+    for pub in pubs:
+        if pub["JIF Percentile"] >= 75:
+            pub["JIF Quartile"] = 1
+        elif pub["JIF Percentile"] >= 50:
+            pub["JIF Quartile"] = 2
+        elif pub["JIF Percentile"] >= 25:
+            pub["JIF Quartile"] = 3
+        else:
+            pub["JIF Quartile"] = 4
+
+
+def addAltmetric(pubs, altmetrics):
+    # Adds Altmetric counts to each pub, returning the fields added
+    fields = set()
+    pubsByPMID = {pub["pmid"]: pub for pub in pubs}
+    for info in altmetrics.values():
+        if info is None:
+            continue
+        pub = pubsByPMID.get(int(info["pmid"]))
+        if pub is None:
+            continue
+        for key in info.keys():
+            if key[0:5] == "cited":
+                if isinstance(info[key], str) and info[key].isnumeric():
+                    pub[key] = int(info[key])
+                    fields.add(key)
+                elif isinstance(info[key], int) or \
+                    isinstance(info[key], float):
+                        pub[key] = info[key]
+                        fields.add(key)
+    return fields
+
+
+# Stages of the assessment. Each takes an iterable of batches of
+# publications and generates them once its work on them is done, so batches
+# flow through while later ones are still being fetched.
+
+def iCiteStage(pmidBatches, cache, log):
+    #Search iCite for Relative Criteria Ratio
+    count = 0
+    for pmids in pmidBatches:
+        with phase("icite"):
+            pubs = getPubs(pmids, cache)
+        count += len(pubs)
+        yield pubs
+    log("iCite data collected for {} publications".format(count))
+
+
+def classifyStage(batches, classifier, config, unresolved):
+    for pubs in batches:
+        if classifier is None:
+            for pub in pubs:
+                pub["TR&D"] = 'Total'
+        else:
+            with phase("classify"):
+                classifyPubs(pubs, classifier, config, unresolved)
+        yield pubs
+
+
+def jifStage(batches, config, unresolved):
+    #Import journal metrics and previously resolved aliases
+    with phase("jif"):
+        aliasStore = config.aliasStore or AliasStore.load(config.cacheDir)
+        metrics = config.metricsStore or \
+            MetricsStore.load(config.metrics, config.cacheDir)
+        journalIndex = config.journalIndex or \
+            JournalIndex.fromTitles(metrics.fullTitles(), aliasStore.confirmed)
+    for pubs in batches:
+        with phase("jif"):
+            matchJournals(pubs, journalIndex, metrics, aliasStore, config,
+                unresolved)
+        yield pubs
+    aliasStore.save()
+    config.log("Journal Impact Factor Information Added.")
+
+
+def altmetricStage(batches, cache, log):
+    missing = 0
+    absent = 0
+    for pubs in batches:
+        with phase("altmetric"):
+            pmids = [str(pub["pmid"]) for pub in pubs]
+            altmetrics = cache.fetchThrough("altmetric", pmids,
+                fetchAltmetric)
+            missing += len(pmids) - len(altmetrics)
+            absent += list(altmetrics.values()).count(None)
+            addAltmetric(pubs, altmetrics)
+        yield pubs
+    if missing and cache.mode == OFFLINE:
+        log("{} articles have no cached Altmetric data.".format(missing))
+    elif missing:
+        log("Error getting {} articles (may be rate-limited)".format(missing))
+    if absent:
+        log("Not all articles on Altmetric. Data will be incomplete.")
+    log("Altmetric Data Added.")
+
+
+def enrich(pmids, config, cache, unresolved, classifier=None):
+    # Streams pmids (any iterable, e.g. a search still paging in) through
+    # the stages, generating batches of finished publications. The network
+    # bound stages and the journal matching each run in their own thread,
+    # with at most QUEUE_DEPTH batches waiting between stages, so fetching,
+    # matching and the caller's aggregation overlap. The stages run in the
+    # calling thread instead when someone may be asked about publications,
+    # so prompts are not interleaved with other stages' output, and under
+    # cProfile, which only sees the thread that started it.
+    inline = config.askTRD is not None or \
+        config.confirmJournal is not None or profilingCalls()
+    stage = (lambda batches: batches) if inline else threaded
+    batches = stage(timed("esearch", batched(pmids)))
+    batches = stage(iCiteStage(batches, cache, config.log))
+    batches = stage(jifStage(classifyStage(batches, classifier, config,
+        unresolved), config, unresolved))
+    if config.altmetric:
+        batches = stage(altmetricStage(batches, cache, config.log))
+    return batches
+
+
+def run(config):
+    # Runs the assessment described by config and returns its Result.
+    # Raises RunError or FetchError if the data cannot be obtained.
+    log = config.log
+    unresolved = []
+    classifier = None
+    trdList = ['Total']
+    if config.classify:
+        classifier = config.classifier or Classifier.fromFile(config.rules)
+        trdList = classifier.choices + ['Total']
+
+    # Reuse what earlier runs of the same search found, only processing
+    # PMIDs that are new, stale or still await a TR&D
+    state = None
+    saved = {}
+    reused = {}
+    if config.incremental:
+        pmidKey = config.pmids if config.pmidSource is None else \
+            {"source": config.pmidSource}
+        state = RunState.open(runKey(config.searchURL, pmidKey,
+            config.classify, config.rules, config.altmetric, config.metrics),
+            config.cacheDir)
+        fresh, stale = state.pubs(config.maxAge)
+        saved = dict(stale, **fresh)
+        reused = {pmid: pub for pmid, pub in fresh.items()
+            if not (config.classify and pub["TR&D"] is None)}
+
+    # Summary columns are filled in as publications arrive
+    table = PublicationTable()
+    pmidList = []
+    newPubs = []
+    cache = ResponseCache.open(config.cacheMode, config.cacheDir)
+    try:
+        #Search PubMed for IDs and enrich them as they come in
+        todo = (pmid for pmid in collect(streamPMIDs(config, cache), pmidList)
+            if pmid not in reused)
+        for pubs in enrich(todo, config, cache, unresolved, classifier):
+            newPubs.extend(pubs)
+            for pub in pubs:
+                table.append(pub)
+    finally:
+        cache.close()
+
+    # PMIDs that have dropped out of the search are not reused but removed,
+    # so their summary rows are recomputed
+    removed = set(saved) - set(pmidList)
+    if config.incremental:
+        reused = {pmid: reused[pmid] for pmid in pmidList if pmid in reused}
+        for pub in reused.values():
+            table.append(pub)
+        log("Reused {} publications from the last run.".format(len(reused)))
+
+    byPMID = dict(reused)
+    byPMID.update((str(pub["pmid"]), pub) for pub in newPubs)
+    pubs = [byPMID[pmid] for pmid in pmidList if pmid in byPMID]
+    if not pubs:
+        raise RunError("No iCite data found for this search.")
+    summaryHeader = (['TR&D'] if config.classify else []) + SUMMARY_HEADER
+
+    # Create header fields for Publications spreadsheet
+    pubsHeader = {"TR&D", "JIF", "JIF Percentile", "JIF Quartile"}
+    for pub in pubs:
+        pubsHeader.update(pub.keys())
+
+    # Determine summary statistics for each TR&D and year. Re-runs only
+    # redo the rows whose publications were added, removed or reprocessed.
+    oldSummary = None if state is None else state.summary()
+    with phase("summary"):
+        if oldSummary is None:
+            summary = table.summarize(trdList)
+        else:
+            changed = {(pub["TR&D"], pub["year"]) for pub in newPubs}
+            changed.update((pub["TR&D"], pub["year"])
+                for pmid, pub in saved.items()
+                if pmid not in reused or pmid in removed)
+            summary = updateSummary(oldSummary, pubs, trdList, changed)
+    if state is not None:
+        removed.update(pmid for pmid in saved if pmid not in byPMID)
+        state.save(newPubs, sorted(removed), summary)
+        state.close()
+
+    result = Result(pmidList, pubs, sorted(pubsHeader), summary,
+        summaryHeader, unresolved)
+
+    if config.output is not None:
+        with phase("export"):
+            result.outputFiles = writeOutput(config.output, pubs,
+                result.pubsHeader, summary, summaryHeader)
+        result.output = config.output
+    if unresolved and config.unresolved == QUEUE:
+        result.reviewFile = config.reviewFile
+        if result.reviewFile is None and config.output is not None:
+            result.reviewFile = os.path.splitext(config.output)[0] + \
+                " Review.csv"
+        if result.reviewFile is not None:
+            writeReview(result.reviewFile, unresolved)
+            log("{} items need review. See {}".format(len(unresolved),
+                result.reviewFile))
+    return result
@@ -0,0 +1,48 @@
+# Locations shared by the NCAN Bibliometric Assessment's on-disk stores.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import contextlib
+import os
+import tempfile
+from importlib import resources
+
+
+def packageFile(name):
+    # Path of a data file installed with the package, e.g. the JCR index
+    return str(resources.files('ncan_bibrun').joinpath(name))
+
+
+def cacheDir(path=None):
+    # Directory for the assessment's caches: the given path, else
+    # $NCAN_BIBRUN_CACHE_DIR, else ncan_bibrun under the user's cache dir
+    if path is None:
+        path = os.environ.get("NCAN_BIBRUN_CACHE_DIR")
+    if path is None:
+        base = os.environ.get("XDG_CACHE_HOME") or \
+            os.path.join(os.path.expanduser('~'), ".cache")
+        path = os.path.join(base, "ncan_bibrun")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextlib.contextmanager
+def replacing(path, mode='w'):
+    # Opens a uniquely named temporary file next to path and replaces path
+    # with it once written. Readers never see a partial file, and processes
+    # writing the same path at once do not truncate each other's; the last
+    # to finish wins.
+    handle, temporary = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+        suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(handle, mode) as tempFile:
+            yield tempFile
+        os.replace(temporary, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        raise
@@ -0,0 +1,79 @@
+# Remembers the results of earlier runs of the same search, so a re-run only
+# processes PMIDs that are new or stale and only recomputes the summary rows
+# they affect.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from ncan_bibrun.settings import cacheDir
+
+# How long a publication's results are reused before it is processed again
+MAX_AGE = 30*24*60*60
+
+
+def runKey(*parts):
+    # Identifies a run by its search and every setting that changes results
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class RunState:
+    # SQLite store of each run's enriched publications (iCite record, TR&D,
+    # JIF match and Altmetric counts) and its summary rows
+
+    FILE_NAME = "runstate.sqlite"
+
+    def __init__(self, path, key):
+        self.key = key
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS pubs (run TEXT, "
+            "pmid TEXT, pub TEXT, updated REAL, PRIMARY KEY (run, pmid))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS summaries (run TEXT "
+            "PRIMARY KEY, rows TEXT)")
+        self.db.commit()
+
+    @classmethod
+    def open(cls, key, directory=None):
+        return cls(os.path.join(cacheDir(directory), cls.FILE_NAME), key)
+
+    def close(self):
+        self.db.close()
+
+    def pubs(self, maxAge=MAX_AGE):
+        # Returns a dict of PMID to publication for results still fresh, and
+        # a dict of the stale ones
+        oldest = time.time() - maxAge
+        fresh = {}
+        stale = {}
+        for pmid, pub, updated in self.db.execute("SELECT pmid, pub, updated "
+            "FROM pubs WHERE run = ?", [self.key]):
+            if updated >= oldest:
+                fresh[pmid] = json.loads(pub)
+            else:
+                stale[pmid] = json.loads(pub)
+        return fresh, stale
+
+    def summary(self):
+        row = self.db.execute("SELECT rows FROM summaries WHERE run = ?",
+            [self.key]).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save(self, pubs, removed, summary):
+        # Stores newly processed pubs, drops removed PMIDs and replaces the
+        # summary rows
+        now = time.time()
+        self.db.executemany("INSERT OR REPLACE INTO pubs VALUES (?, ?, ?, ?)",
+            [(self.key, str(pub["pmid"]), json.dumps(pub), now)
+            for pub in pubs])
+        self.db.executemany("DELETE FROM pubs WHERE run = ? AND pmid = ?",
+            [(self.key, pmid) for pmid in removed])
+        self.db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?)",
+            [self.key, json.dumps(summary)])
+        self.db.commit()
@@ -0,0 +1,83 @@
+# Building blocks for running the NCAN Bibliometric Assessment as a chain of
+# generator stages, so publications flow from one stage to the next as soon
+# as each batch is ready instead of every stage waiting for the last.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+import queue
+import threading
+
+# PMIDs per batch flowing between stages. Large enough that the iCite and
+# Altmetric stages still fetch each batch with several concurrent requests.
+BATCH_SIZE = 1000
+
+# Batches a threaded stage may finish ahead of its consumer
+QUEUE_DEPTH = 2
+
+
+def batched(items, size=BATCH_SIZE):
+    # Groups any iterable into lists of up to size items
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect(items, into):
+    # Generates items, also appending each to the list into
+    for item in items:
+        into.append(item)
+        yield item
+
+
+def threaded(stage, depth=QUEUE_DEPTH):
+    # Runs the generator stage in a background thread, generating its items
+    # through a queue of at most depth items, so the stage works ahead (e.g.
+    # on the next network request) while its consumer is busy. Exceptions in
+    # the stage are raised in the consumer. Closing the returned generator
+    # stops the stage and waits for its thread, so nothing outlives it.
+    items = queue.Queue(depth)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in stage:
+                if not put((True, item)):
+                    return
+        except BaseException as error:
+            put((False, error))
+        else:
+            put((False, None))
+        finally:
+            stage.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            more, value = items.get()
+            if not more:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stopped.set()
+        thread.join()
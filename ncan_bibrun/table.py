@@ -0,0 +1,187 @@
+# Columnar table of the publication fields used in the NCAN Bibliometric
+# Assessment's summaries, with group-by reductions over the columns.
+#
+# Created for internal use at the National Center for Adaptive
+# Neurotechnologies
+#
+# Clone the GitHub Repository here:
+# https://github.com/Schmill731/NCAN-Bibliometric-Analysis
+
+from array import array
+from ncan_bibrun.aggregate import ALTMETRIC_FIELDS, authorCounts, emptyRow
+from ncan_bibrun.instrument import phase
+
+# NumPy is optional; without it the reductions loop over the columns. It is
+# slow to import, so loadNumpy() only imports it once a table is summarized.
+numpy = None
+
+NAN = float("nan")
+
+
+def wholeNumber(value):
+    # Counts are summed as floats; report whole ones as ints
+    return int(value) if value.is_integer() else value
+
+
+def loadNumpy():
+    # Returns the numpy module, or None if it is not installed
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+    return numpy or None
+
+
+class PublicationTable:
+    # Numeric fields live in typed arrays, one value per publication; None
+    # becomes NaN. TR&Ds are stored as indexes into trdValues. Text fields
+    # are kept in plain lists alongside.
+
+    NUMERIC = ["relative_citation_ratio", "nih_percentile", "JIF",
+        "JIF Percentile", "JIF Quartile"] + list(ALTMETRIC_FIELDS)
+
+    def __init__(self):
+        self.pmid = array('q')
+        self.year = array('i')
+        self.trd = array('i')
+        self.columns = {field: array('d') for field in self.NUMERIC}
+        self.trdValues = []
+        self.trdCodes = {}
+        self.authors = []
+        self.title = []
+        self.journal = []
+
+    def __len__(self):
+        return len(self.year)
+
+    @classmethod
+    def fromPubs(cls, pubs):
+        table = cls()
+        for pub in pubs:
+            table.append(pub)
+        return table
+
+    def append(self, pub):
+        trd = pub.get("TR&D")
+        if trd not in self.trdCodes:
+            self.trdCodes[trd] = len(self.trdValues)
+            self.trdValues.append(trd)
+        self.pmid.append(int(pub["pmid"]))
+        self.year.append(pub["year"])
+        self.trd.append(self.trdCodes[trd])
+        for field, column in self.columns.items():
+            value = pub.get(field)
+            column.append(NAN if value is None else value)
+        self.authors.append(pub.get("authors"))
+        self.title.append(pub.get("title"))
+        self.journal.append(pub.get("journal"))
+
+    def pubs(self):
+        # Minimal records with the fields authorCounts() needs
+        return [{"TR&D": self.trdValues[trd], "year": year, "authors": authors}
+            for trd, year, authors in zip(self.trd, self.year, self.authors)]
+
+    def groupSums(self, trdList, minYear, numYears):
+        # Returns the per-(TR&D, year) count, Q1 count and column sums, each
+        # a list indexed by trdList position*numYears + year offset. NaNs and
+        # missing Altmetric counts add nothing.
+        if loadNumpy() is not None:
+            return self.groupSumsNumpy(trdList, minYear, numYears)
+        size = len(trdList)*numYears
+        rowOf = {self.trdCodes[trd]: index
+            for index, trd in enumerate(trdList) if trd in self.trdCodes}
+        total = trdList.index("Total") if "Total" in trdList else None
+        counts = [0]*size
+        q1 = [0]*size
+        sums = {field: [0.0]*size for field in self.columns}
+        fields = list(self.columns)
+        for i in range(len(self)):
+            offset = self.year[i] - minYear
+            groups = []
+            if self.trd[i] in rowOf:
+                groups.append(rowOf[self.trd[i]]*numYears + offset)
+            if total is not None and self.trdValues[self.trd[i]] != "Total":
+                groups.append(total*numYears + offset)
+            for group in groups:
+                counts[group] += 1
+                if self.columns["JIF Quartile"][i] == 1:
+                    q1[group] += 1
+                for field in fields:
+                    value = self.columns[field][i]
+                    if value == value:
+                        sums[field][group] += value
+        return counts, q1, sums
+
+    def groupSumsNumpy(self, trdList, minYear, numYears):
+        size = len(trdList)*numYears
+        offsets = numpy.frombuffer(self.year, dtype=numpy.int32) - minYear
+        codes = numpy.frombuffer(self.trd, dtype=numpy.int32)
+        q1 = numpy.frombuffer(self.columns["JIF Quartile"],
+            dtype=numpy.float64) == 1
+
+        # Map each TR&D code to its position in trdList (-1 if not listed)
+        rowOf = numpy.full(len(self.trdValues), -1, dtype=numpy.int64)
+        for index, trd in enumerate(trdList):
+            if trd in self.trdCodes:
+                rowOf[self.trdCodes[trd]] = index
+        rows = rowOf[codes]
+        keep = rows >= 0
+        groupParts = [(rows[keep]*numYears + offsets[keep], keep)]
+        if "Total" in trdList:
+            notTotal = codes != self.trdCodes.get("Total", -1)
+            groupParts.append((trdList.index("Total")*numYears +
+                offsets[notTotal], notTotal))
+
+        counts = numpy.zeros(size)
+        q1Counts = numpy.zeros(size)
+        sums = {field: numpy.zeros(size) for field in self.columns}
+        for groups, mask in groupParts:
+            counts += numpy.bincount(groups, minlength=size)
+            q1Counts += numpy.bincount(groups, weights=q1[mask], minlength=size)
+            for field, column in self.columns.items():
+                values = numpy.frombuffer(column, dtype=numpy.float64)[mask]
+                sums[field] += numpy.bincount(groups,
+                    weights=numpy.nan_to_num(values), minlength=size)
+        return ([int(count) for count in counts],
+            [int(count) for count in q1Counts],
+            {field: total.tolist() for field, total in sums.items()})
+
+    def summarize(self, trdList):
+        # Same rows as ncan_bibrun.aggregate.summarize(pubs, trdList)
+        if len(self) == 0:
+            return []
+        minYear = min(self.year)
+        maxYear = max(self.year)
+        numYears = maxYear - minYear + 1
+        counts, q1, sums = self.groupSums(trdList, minYear, numYears)
+        with phase("authors"):
+            authorStats = authorCounts(self.pubs(), trdList, minYear, maxYear)
+
+        rows = []
+        for index, trd in enumerate(trdList):
+            for offset in range(numYears):
+                group = index*numYears + offset
+                row = emptyRow(trd, minYear + offset)
+                row["Unique Authors"], row["New Authors"] = \
+                    authorStats[(trd, minYear + offset)]
+                count = counts[group]
+                row["Count"] = count
+                row["Weighted RCR"] = sums["relative_citation_ratio"][group]
+                row["Num in JIF Q1"] = q1[group]
+                row["Sum JIF"] = sums["JIF"][group]
+                for field, column in ALTMETRIC_FIELDS.items():
+                    row[column] = wholeNumber(sums[field][group])
+                if count:
+                    row["Mean RCR"] = row["Weighted RCR"]/count
+                    row["Average NIH Percentile"] = \
+                        sums["nih_percentile"][group]/count
+                    row["Percent in JIF Q1"] = q1[group]/count
+                    row["Average JIF Quartile"] = \
+                        sums["JIF Quartile"][group]/count
+                    row["Average JIF"] = row["Sum JIF"]/count
+                    row["Average JIF Percentile"] = \
+                        sums["JIF Percentile"][group]/count
+                rows.append(row)
+        return rows
@@ -16,7 +16,9 @@ setup(name='ncan_bibrun',
       license='NCAN',
       packages=['ncan_bibrun'],
       install_requires=['requests', 'xlsxwriter'],
-      scripts=['bin/ncan-bibrun'],
+      extras_require={'fast': ['numpy'], 'parquet': ['pyarrow']},
+      entry_points={'console_scripts': ['ncan-bibrun=ncan_bibrun.cli:main']},
+      python_requires='>=3.9',
       include_package_data=True,
       long_description=readme(),
       zip_safe=False)